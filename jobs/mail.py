@@ -0,0 +1,141 @@
+"""Почтовый бэкенд с очередью.
+
+QueuedEmailBackend только сохраняет письма, задача deliver_emails
+отправляет их через EMAIL_DELIVERY_BACKEND по одному соединению.
+Повторы после ошибок подбирает периодический запуск той же задачи.
+Письма захватываются условным UPDATE, поэтому параллельные запуски
+не отправят одно письмо дважды.
+"""
+import datetime as dt
+import json
+import uuid
+from email import message_from_bytes
+from email.generator import BytesGenerator
+from email.message import Message
+from io import BytesIO
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutgoingEmail
+from .queue import enqueue
+
+DELIVER_TASK = 'jobs.tasks.deliver_emails'
+
+
+class RawMessage(Message):
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        fp = BytesIO()
+        generator = BytesGenerator(
+            fp, mangle_from_=False, policy=self.policy.clone(linesep=linesep))
+        generator.flatten(self, unixfrom=unixfrom)
+        return fp.getvalue()
+
+
+class StoredEmail(EmailMessage):
+    """Уже собранное письмо, которое принимает любой бэкенд Django."""
+
+    def __init__(self, outgoing, started=None):
+        super().__init__(from_email=outgoing.from_email,
+                         to=json.loads(outgoing.recipients))
+        self.outgoing = outgoing
+        self.raw = bytes(outgoing.message)
+        self.started = started
+
+    def message(self):
+        # бэкенды собирают письмо перед самой отправкой: так видно,
+        # до какого письма пачки дошла отправка
+        if self.started is not None:
+            self.started.append(self.outgoing)
+        return message_from_bytes(self.raw, _class=RawMessage)
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        rows = [
+            OutgoingEmail(
+                from_email=message.from_email,
+                recipients=json.dumps(message.recipients()),
+                message=message.message().as_bytes(),
+            )
+            for message in email_messages if message.recipients()
+        ]
+        OutgoingEmail.objects.bulk_create(rows)
+        if rows:
+            enqueue(DELIVER_TASK, key=DELIVER_TASK, priority=10)
+        return len(rows)
+
+
+def retry_delay(attempts):
+    backoff = getattr(settings, 'EMAIL_RETRY_BACKOFF', 30)
+    return dt.timedelta(seconds=min(backoff * 2 ** (attempts - 1), 60 * 60))
+
+
+def claim(batch_size):
+    """Захватывает до batch_size готовых писем. Захват истекает через
+    EMAIL_CLAIM_TIMEOUT секунд, если отправка оборвалась."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    ready = OutgoingEmail.objects.filter(
+        Q(status=OutgoingEmail.QUEUED) | Q(status=OutgoingEmail.SENDING),
+        next_attempt__lte=now)
+    ids = list(ready.values_list('pk', flat=True)[:batch_size])
+    ready.filter(pk__in=ids).update(
+        status=OutgoingEmail.SENDING, claim=token,
+        next_attempt=now + dt.timedelta(seconds=getattr(
+            settings, 'EMAIL_CLAIM_TIMEOUT', 10 * 60)))
+    return list(OutgoingEmail.objects.filter(
+        status=OutgoingEmail.SENDING, claim=token))
+
+
+def fail(outgoing, error, max_attempts):
+    outgoing.attempts += 1
+    outgoing.last_error = repr(error)
+    if outgoing.attempts >= max_attempts:
+        outgoing.status = OutgoingEmail.FAILED
+    else:
+        outgoing.status = OutgoingEmail.QUEUED
+        outgoing.next_attempt = timezone.now() + retry_delay(outgoing.attempts)
+    outgoing.save(update_fields=[
+        'status', 'attempts', 'next_attempt', 'last_error'])
+
+
+def deliver(batch_size=None):
+    """Отправляет готовые письма, возвращает число отправленных."""
+    batch_size = batch_size or getattr(settings, 'EMAIL_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'EMAIL_MAX_ATTEMPTS', 5)
+    connection = get_connection(settings.EMAIL_DELIVERY_BACKEND)
+    sent = 0
+    with connection:
+        while True:
+            batch = claim(batch_size)
+            if not batch:
+                break
+            started = []
+            try:
+                connection.send_messages(
+                    [StoredEmail(outgoing, started) for outgoing in batch])
+            except Exception as error:
+                if not started:
+                    # не дошли до первого письма - ошибка соединения
+                    for outgoing in batch:
+                        fail(outgoing, error, max_attempts)
+                    break
+                # письма до сломавшегося ушли, после него - не начаты
+                *done, broken = started
+                fail(broken, error, max_attempts)
+                OutgoingEmail.objects.filter(
+                    pk__in=[outgoing.pk for outgoing in batch],
+                    status=OutgoingEmail.SENDING,
+                ).exclude(pk__in=[outgoing.pk for outgoing in started]).update(
+                    status=OutgoingEmail.QUEUED, next_attempt=timezone.now())
+            else:
+                done = batch
+            OutgoingEmail.objects.filter(
+                pk__in=[outgoing.pk for outgoing in done]).update(
+                status=OutgoingEmail.SENT)
+            sent += len(done)
+    return sent
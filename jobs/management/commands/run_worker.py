@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker, run_pending, start_periodic
+from yatube import memory, metrics
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выполнить готовые задачи и завершиться')
+
+    def handle(self, *args, **options):
+        if options['burst']:
+            start_periodic()
+            done = run_pending()
+            metrics.registry.flush(force=True)
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        memory.enable()
+        worker = Worker(options['threads'], options['poll_interval'])
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: worker.stop())
+        worker.run()
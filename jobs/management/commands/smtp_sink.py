@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from jobs.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = 'Локальный SMTP-сервер, печатающий принятые письма'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=1025)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(options['host'], options['port'],
+                        on_message=self.show)
+        self.stdout.write(f'Слушаю {options["host"]}:{sink.port}')
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            sink.server_close()
+
+    def show(self, message):
+        self.stdout.write(f'{message["from"]} -> {", ".join(message["to"])}')
+        self.stdout.write(message['data'].decode('utf-8', 'replace'))
@@ -0,0 +1,74 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField(max_length=200, verbose_name='Задача')
+    args = models.TextField(default='[]')
+    kwargs = models.TextField(default='{}')
+    priority = models.SmallIntegerField(default=0,
+                                        verbose_name='Приоритет')
+    run_at = models.DateTimeField(default=timezone.now,
+                                  verbose_name='Запуск не раньше')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    # уникальный ключ не даёт поставить одну задачу дважды,
+    # освобождается после завершения
+    key = models.CharField(max_length=200, unique=True,
+                           blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.task} [{self.status}]'
+
+    class Meta:
+        ordering = ['-priority', 'run_at']
+        indexes = [models.Index(fields=['status', 'run_at'])]
+        verbose_name = 'Задача'
+        verbose_name_plural = 'Задачи'
+
+
+class OutgoingEmail(models.Model):
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (SENDING, 'Отправляется'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    )
+
+    from_email = models.CharField(max_length=254)
+    recipients = models.TextField()
+    message = models.BinaryField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # у отправляемого письма - срок захвата
+    next_attempt = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['next_attempt']
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+        verbose_name = 'Письмо'
+        verbose_name_plural = 'Исходящие письма'
@@ -0,0 +1,65 @@
+"""Очередь фоновых задач в базе данных.
+
+Задача - любая функция уровня модуля, аргументы должны сериализоваться
+в JSON. Периодические задачи объявляются декоратором periodic в модулях
+tasks.py приложений, их подхватывает manage.py run_worker.
+"""
+import datetime as dt
+import json
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Job
+
+PERIODIC = {}
+
+
+def task_path(func):
+    if isinstance(func, str):
+        return func
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def periodic(every):
+    if not isinstance(every, dt.timedelta):
+        every = dt.timedelta(seconds=every)
+
+    def decorator(func):
+        PERIODIC[task_path(func)] = every
+        return func
+    return decorator
+
+
+def enqueue(func, *args, priority=0, delay=None, run_at=None, key=None,
+            max_attempts=5, **kwargs):
+    """Ставит задачу в очередь.
+
+    Если задача с таким key уже ждёт выполнения, возвращает None.
+    """
+    if run_at is None:
+        run_at = timezone.now()
+        if delay is not None:
+            if not isinstance(delay, dt.timedelta):
+                delay = dt.timedelta(seconds=delay)
+            run_at += delay
+    job = Job(
+        task=task_path(func),
+        args=json.dumps(args),
+        kwargs=json.dumps(kwargs),
+        priority=priority,
+        run_at=run_at,
+        key=key,
+        max_attempts=max_attempts,
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+    return job
+
+
+def schedule_periodic(path, delay=None):
+    return enqueue(path, delay=PERIODIC[path] if delay is None else delay,
+                   key=f'periodic:{path}')
@@ -0,0 +1,27 @@
+import datetime as dt
+
+from django.conf import settings
+from django.utils import timezone
+
+from .mail import deliver
+from .models import Job, OutgoingEmail
+from .queue import periodic
+
+
+@periodic(every=60)
+def deliver_emails():
+    deliver()
+
+
+@periodic(every=24 * 60 * 60)
+def purge_finished():
+    keep = dt.timedelta(days=getattr(settings, 'JOB_KEEP_DAYS', 7))
+    before = timezone.now() - keep
+    Job.objects.filter(
+        status__in=(Job.DONE, Job.FAILED),
+        run_at__lt=before,
+    ).delete()
+    OutgoingEmail.objects.filter(
+        status=OutgoingEmail.SENT,
+        created__lt=before,
+    ).delete()
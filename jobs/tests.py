@@ -0,0 +1,178 @@
+import datetime as dt
+import threading
+from unittest import mock
+
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.mail import claim, deliver
+from jobs.models import Job, OutgoingEmail
+from jobs.queue import PERIODIC, enqueue
+from jobs.smtp_sink import SMTPSink
+from jobs.worker import Worker, requeue_stale, run_pending, touch
+from posts.models import User
+
+CALLS = []
+
+
+def record(value):
+    CALLS.append(value)
+
+
+def explode():
+    raise RuntimeError('boom')
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('smtp down')
+
+
+class SecondFailsBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        for number, message in enumerate(email_messages):
+            message.message()
+            if number == 1:
+                raise ConnectionError('rejected')
+            mail.outbox.append(message)
+        return len(email_messages)
+
+
+class QueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def test_run_in_priority_order(self):
+        enqueue(record, 'low')
+        enqueue(record, 'high', priority=5)
+        enqueue(record, 'later', delay=60)
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(CALLS, ['high', 'low'])
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+    def test_key_deduplicates(self):
+        self.assertIsNotNone(enqueue(record, 1, key='once'))
+        self.assertIsNone(enqueue(record, 2, key='once'))
+        run_pending()
+        self.assertIsNotNone(enqueue(record, 3, key='once'))
+
+    def test_retry_with_backoff(self):
+        job = enqueue(explode, max_attempts=2)
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_periodic_reschedules(self):
+        PERIODIC['jobs.tests.record'] = dt.timedelta(hours=1)
+        try:
+            enqueue(record, 'tick')
+            run_pending()
+        finally:
+            del PERIODIC['jobs.tests.record']
+        self.assertTrue(Job.objects.filter(
+            key='periodic:jobs.tests.record', status=Job.QUEUED).exists())
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_heartbeat_keeps_lease(self):
+        long_ago = timezone.now() - dt.timedelta(hours=1)
+        alive = enqueue(record, 'alive')
+        dead = enqueue(record, 'dead')
+        Job.objects.update(status=Job.RUNNING, locked_at=long_ago)
+        touch([alive.pk])
+        self.assertEqual(requeue_stale(), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, Job.RUNNING)
+        self.assertEqual(dead.status, Job.QUEUED)
+
+    @mock.patch('jobs.worker.start_periodic')
+    @mock.patch('jobs.worker.claim')
+    def test_stop_while_waiting_for_slot(self, claim_job, start_periodic):
+        worker = Worker(threads=1)
+        worker.slots.acquire()
+
+        def stop():
+            worker.stop()
+            worker.slots.release()
+        timer = threading.Timer(0.05, stop)
+        timer.start()
+        worker.run()
+        timer.join()
+        claim_job.assert_not_called()
+
+
+@override_settings(
+    EMAIL_BACKEND='jobs.mail.QueuedEmailBackend',
+    EMAIL_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class QueuedEmailTest(TestCase):
+    def test_password_reset_is_queued(self):
+        User.objects.create_user('reset', 'reset@test.ru', 'pass')
+        response = Client().post(reverse('password_reset'),
+                                 {'email': 'reset@test.ru'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+        run_pending()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['reset@test.ru'])
+        self.assertIn('reset', mail.outbox[0].message().as_string())
+
+    def test_smtp_single_connection(self):
+        sink = SMTPSink().start()
+        try:
+            for i in range(3):
+                send_mail(f'тема {i}', 'текст', 'from@test.ru',
+                          [f'to{i}@test.ru'])
+            with self.settings(
+                    EMAIL_DELIVERY_BACKEND=(
+                        'django.core.mail.backends.smtp.EmailBackend'),
+                    EMAIL_HOST='127.0.0.1', EMAIL_PORT=sink.port):
+                self.assertEqual(deliver(), 3)
+        finally:
+            sink.stop()
+        self.assertEqual(sink.sessions, 1)
+        self.assertEqual(len(sink.messages), 3)
+        self.assertEqual(sink.messages[0]['to'], ['<to0@test.ru>'])
+
+    @override_settings(EMAIL_DELIVERY_BACKEND='jobs.tests.FailingBackend')
+    def test_retry_after_failure(self):
+        send_mail('тема', 'текст', 'from@test.ru', ['to@test.ru'])
+        self.assertEqual(deliver(), 0)
+        outgoing = OutgoingEmail.objects.get()
+        self.assertEqual(outgoing.status, OutgoingEmail.QUEUED)
+        self.assertEqual(outgoing.attempts, 1)
+        self.assertGreater(outgoing.next_attempt, timezone.now())
+
+    def test_claimed_once(self):
+        for i in range(3):
+            send_mail('тема', 'текст', 'from@test.ru', [f'to{i}@test.ru'])
+        first = claim(2)
+        second = claim(10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(claim(10), [])
+        self.assertEqual(deliver(), 0)
+
+    @override_settings(EMAIL_DELIVERY_BACKEND='jobs.tests.SecondFailsBackend')
+    def test_partial_batch_failure(self):
+        for i in range(3):
+            send_mail('тема', 'текст', 'from@test.ru', [f'to{i}@test.ru'])
+        self.assertEqual(deliver(), 2)
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['to0@test.ru'], ['to2@test.ru']])
+        broken = OutgoingEmail.objects.get(recipients='["to1@test.ru"]')
+        self.assertEqual(broken.status, OutgoingEmail.QUEUED)
+        self.assertEqual(broken.attempts, 1)
+        self.assertEqual(OutgoingEmail.objects.filter(
+            status=OutgoingEmail.SENT).count(), 2)
@@ -0,0 +1,163 @@
+import datetime as dt
+import json
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules, import_string
+
+from yatube import metrics
+
+from .models import Job
+from .queue import PERIODIC, schedule_periodic
+
+logger = logging.getLogger('jobs')
+
+
+def retry_delay(attempts):
+    backoff = getattr(settings, 'JOB_RETRY_BACKOFF', 10)
+    return min(backoff * 2 ** (attempts - 1), 60 * 60)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 60)
+
+
+def touch(pks):
+    """Продлевает захват выполняющихся задач."""
+    return Job.objects.filter(pk__in=pks, status=Job.RUNNING).update(
+        locked_at=timezone.now())
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи упавших воркеров: живой воркер
+    обновляет locked_at своих задач каждые JOB_HEARTBEAT_INTERVAL
+    секунд, у упавшего отметка перестаёт обновляться."""
+    timeout = getattr(settings, 'JOB_TIMEOUT', 10 * 60)
+    stale = timezone.now() - dt.timedelta(seconds=timeout)
+    return Job.objects.filter(
+        status=Job.RUNNING, locked_at__lt=stale
+    ).update(status=Job.QUEUED, locked_at=None)
+
+
+def claim():
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by('-priority', 'run_at', 'pk')
+        .values_list('pk', flat=True)[:10]
+    )
+    for pk in candidates:
+        # захват условным UPDATE, чтобы два воркера не взяли одну задачу
+        taken = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, locked_at=now)
+        if taken:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def run_job(job):
+    job.attempts += 1
+    try:
+        func = import_string(job.task)
+        func(*json.loads(job.args), **json.loads(job.kwargs))
+    except Exception:
+        job.last_error = traceback.format_exc()
+        logger.exception('Задача %s #%s упала', job.task, job.pk)
+        if job.attempts < job.max_attempts:
+            job.status = Job.QUEUED
+            job.run_at = timezone.now() + dt.timedelta(
+                seconds=retry_delay(job.attempts))
+        else:
+            job.status = Job.FAILED
+            job.key = None
+    else:
+        job.status = Job.DONE
+        job.key = None
+    job.locked_at = None
+    job.save()
+    if job.status != Job.QUEUED and job.task in PERIODIC:
+        schedule_periodic(job.task)
+    return job
+
+
+def run_pending():
+    """Выполняет все готовые задачи в текущем потоке."""
+    done = 0
+    while True:
+        job = claim()
+        if job is None:
+            return done
+        run_job(job)
+        done += 1
+
+
+def start_periodic():
+    autodiscover_modules('tasks')
+    for path in PERIODIC:
+        schedule_periodic(path, delay=0)
+
+
+class Worker:
+    def __init__(self, threads=4, poll_interval=1.0):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.slots = threading.BoundedSemaphore(threads)
+        self.stopping = threading.Event()
+        self.running = set()
+        self.lock = threading.Lock()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _run(self, job):
+        try:
+            run_job(job)
+        finally:
+            with self.lock:
+                self.running.discard(job.pk)
+            close_old_connections()
+            metrics.registry.flush()
+            self.slots.release()
+
+    def _heartbeat(self):
+        """Отдельный поток: пока задачи занимают все потоки, основной
+        цикл ждёт свободного слота и не может продлевать захват."""
+        while not self.stopping.wait(heartbeat_interval()):
+            with self.lock:
+                running = list(self.running)
+            try:
+                if running:
+                    touch(running)
+                requeue_stale()
+            except Exception:
+                logger.exception('Не удалось продлить захват задач')
+            finally:
+                close_old_connections()
+            metrics.registry.flush()
+
+    def run(self):
+        start_periodic()
+        heartbeat = threading.Thread(target=self._heartbeat, daemon=True)
+        heartbeat.start()
+        with ThreadPoolExecutor(self.threads) as pool:
+            while not self.stopping.is_set():
+                self.slots.acquire()
+                if self.stopping.is_set():
+                    # SIGTERM пришёл, пока ждали свободного потока
+                    self.slots.release()
+                    break
+                job = claim()
+                if job is None:
+                    self.slots.release()
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                with self.lock:
+                    self.running.add(job.pk)
+                pool.submit(self._run, job)
+        heartbeat.join()
+        metrics.registry.flush(force=True)
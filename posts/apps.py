@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        # подключают сигналы
+        from . import flatpages, follows, watermarks  # noqa: F401
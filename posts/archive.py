@@ -0,0 +1,72 @@
+import datetime as dt
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedComment, ArchivedPost, Comment, Post
+from .sharding import shard_for, shards
+
+POST_FIELDS = ('id', 'text', 'pub_date', 'author_id', 'group_id', 'image',
+               'hidden')
+COMMENT_FIELDS = ('id', 'author_id', 'post_id', 'text', 'created', 'hidden')
+
+logger = logging.getLogger('posts.archive')
+
+
+def archive_cutoff():
+    days = getattr(settings, 'POST_ARCHIVE_AFTER_DAYS', 365)
+    return timezone.now() - dt.timedelta(days=days)
+
+
+def author_archive(author):
+    return ArchivedPost.objects.using(shard_for(author.pk)).filter(
+        author=author)
+
+
+def archive_posts(cutoff=None, batch_size=500):
+    """Переносит посты старше cutoff вместе с комментариями в архив.
+
+    Каждая пачка переносится отдельной транзакцией, так что задачу
+    можно прервать и перезапустить.
+    """
+    cutoff = cutoff or archive_cutoff()
+    moved = 0
+    for alias in shards():
+        last_pk = 0
+        while True:
+            with transaction.atomic(using=alias):
+                posts = list(
+                    Post.all_objects.using(alias)
+                    .filter(pub_date__lt=cutoff, pk__gt=last_pk)
+                    .order_by('pk')
+                    .values(*POST_FIELDS)[:batch_size]
+                )
+                if not posts:
+                    break
+                last_pk = posts[-1]['id']
+                # занятый в архиве id - чужая запись: такой пост
+                # остаётся в горячей таблице
+                taken = set(
+                    ArchivedPost.all_objects.using(alias)
+                    .filter(pk__in=[post['id'] for post in posts])
+                    .values_list('pk', flat=True)
+                )
+                if taken:
+                    logger.warning('%s: id постов уже заняты в архиве: %s',
+                                   alias, sorted(taken))
+                posts = [post for post in posts if post['id'] not in taken]
+                ids = [post['id'] for post in posts]
+                comments = (
+                    Comment.all_objects.using(alias)
+                    .filter(post_id__in=ids)
+                    .values(*COMMENT_FIELDS)
+                )
+                ArchivedPost.objects.using(alias).bulk_create(
+                    [ArchivedPost(**post) for post in posts])
+                ArchivedComment.objects.using(alias).bulk_create(
+                    [ArchivedComment(**comment) for comment in comments])
+                Post.all_objects.using(alias).filter(pk__in=ids).delete()
+            moved += len(posts)
+    return moved
@@ -0,0 +1,95 @@
+"""Данные карточек постов на всю страницу разом.
+
+Карточки рендерит includes/card_post.html, а prepare заранее загружает
+для всей страницы авторов, группы и число комментариев и ищет каждую
+картинку в sorl один раз. Теги card_image и comment_count шаблона
+берут подготовленное, а для одиночного поста считают сами.
+"""
+import logging
+
+from django.db.models import Count, prefetch_related_objects
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import DummyImageFile
+
+from .tasks import CARD_THUMBNAIL
+
+logger = logging.getLogger('sorl.thumbnail')
+
+
+def load_relations(posts):
+    """Авторы и группы одним запросом на каждую модель постов."""
+    by_model = {}
+    for post in posts:
+        by_model.setdefault(type(post), []).append(post)
+    for items in by_model.values():
+        prefetch_related_objects(items, 'author', 'group')
+
+
+def comment_counts(posts):
+    """Число видимых комментариев по (модель, id) одним запросом
+    на каждую пару модель-база."""
+    groups = {}
+    for post in posts:
+        groups.setdefault((type(post), post._state.db), []).append(post.pk)
+    counts = {}
+    for (model, db), ids in groups.items():
+        comment_model = model._meta.get_field('comments').related_model
+        rows = (comment_model.objects.using(db)
+                .filter(post_id__in=ids)
+                .order_by()
+                .values_list('post_id')
+                .annotate(count=Count('pk')))
+        counts.update(((model, pk), count) for pk, count in rows)
+    return counts
+
+
+def thumbnails(posts):
+    geometry, options = CARD_THUMBNAIL
+    found = {}
+    for post in posts:
+        name = post.image.name if post.image else ''
+        if name in found:
+            continue
+        try:
+            if name:
+                found[name] = get_thumbnail(post.image, geometry, **options)
+            elif sorl_settings.THUMBNAIL_DUMMY:
+                found[name] = DummyImageFile(geometry)
+            else:
+                found[name] = None
+        except Exception:
+            if sorl_settings.THUMBNAIL_DEBUG:
+                raise
+            logger.exception('Thumbnail tag failed')
+            found[name] = None
+    return found
+
+
+def prepare(posts):
+    """Загружает данные карточек posts, возвращает список постов."""
+    posts = list(posts)
+    load_relations(posts)
+    counts = comment_counts(posts)
+    images = thumbnails(posts)
+    for post in posts:
+        post._card = (counts.get((type(post), post.pk), 0),
+                      images[post.image.name if post.image else ''])
+    return posts
+
+
+def card_data(post):
+    card = getattr(post, '_card', None)
+    if card is None:
+        [post] = prepare([post])
+        card = post._card
+    return card
+
+
+class PageCards:
+    """Карточки страницы: данные готовятся для всей страницы сразу,
+    в цикле по постам подключается cards.template."""
+    template = 'includes/card_post.html'
+
+    def __init__(self, posts):
+        prepare(posts)
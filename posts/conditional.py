@@ -0,0 +1,193 @@
+"""Валидаторы для условных GET-запросов.
+
+Каждая функция по аргументам view возвращает части ETag, не трогая
+шаблоны: это один-два запроса по индексам, а автор и пост, найденные
+валидатором, view берёт через once и не ищет заново. Страницы зависят
+от зрителя (ссылки на правку, подписка, меню), поэтому в ETag входит
+id пользователя.
+
+Last-Modified не выдаётся: скрытый или удалённый пост и комментарий
+уменьшают счётчики, но не время последней правки, и клиент с одним
+If-Modified-Since получил бы 304 на изменившуюся страницу.
+"""
+import functools
+import hashlib
+
+from django.db.models import (Count, IntegerField, Max, OuterRef, Subquery,
+                              Value)
+from django.db.models.functions import Coalesce
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_page
+from django.views.decorators.http import conditional_page
+
+from .archive import author_archive
+from .follows import followed_ids
+from .models import ArchivedPost, Follow, Group, Post, User
+from .sharding import author_posts, shards
+
+
+def validate(validators, request, *args, **kwargs):
+    """ETag по validators или None."""
+    parts = validators(request, *args, **kwargs)
+    if parts is None:
+        return None
+    parts = (request.user.pk, request.get_full_path()) + parts
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def set_validators(response, etag):
+    if response.status_code in (200, 304):
+        response.setdefault('ETag', etag)
+    return response
+
+
+def conditional(validators):
+    """Как django.views.decorators.http.condition с одним etag_func."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            etag = validate(validators, request, *args, **kwargs)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return set_validators(response, etag)
+        return wrapper
+    return decorator
+
+
+def cached_conditional(validators, timeout, key_prefix):
+    """conditional для страницы под cache_page.
+
+    validators считаются только при построении страницы, их заголовки
+    кэшируются вместе с ней. 304 снаружи кэша выдаёт conditional_page
+    по заголовкам ответа, так что попадание в кэш обходится без
+    запросов к базе. Внутри кэша 304 не отдаётся: он попал бы в кэш
+    вместо страницы.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def stamped(request, *args, **kwargs):
+            etag = None
+            if request.method in ('GET', 'HEAD'):
+                etag = validate(validators, request, *args, **kwargs)
+            response = view(request, *args, **kwargs)
+            if etag is not None:
+                set_validators(response, etag)
+            return response
+        return conditional_page(
+            cache_page(timeout, key_prefix=key_prefix)(stamped))
+    return decorator
+
+
+def once(request, key, compute):
+    """compute() один раз за запрос: валидаторы и view делят результат."""
+    memo = request.__dict__.setdefault('_conditional', {})
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def count_of(queryset, field):
+    """Подзапрос: число строк queryset, сгруппированных по field."""
+    counted = queryset.order_by().values(field).annotate(
+        count=Count('pk')).values('count')
+    return Coalesce(Subquery(counted, output_field=IntegerField()),
+                    Value(0))
+
+
+def page_author(request, username):
+    """Автор с числом его подписок и подписчиков одним запросом к
+    default или None."""
+    return once(request, ('author', username), lambda: (
+        User.objects.filter(username=username).annotate(
+            follower_count=count_of(
+                Follow.objects.filter(user=OuterRef('pk')), 'user'),
+            following_count=count_of(
+                Follow.objects.filter(author=OuterRef('pk')), 'author'),
+        ).first()))
+
+
+def find_post(author, post_id):
+    for posts in (author_posts(author), author_archive(author)):
+        comments = posts.model._meta.get_field(
+            'comments').related_model.objects.filter(post=OuterRef('pk'))
+        post = posts.filter(pk=post_id).annotate(
+            comment_count=count_of(comments, 'post'),
+            last_comment=Subquery(
+                comments.order_by('-created').values('created')[:1]),
+            post_count=(
+                count_of(Post.objects.filter(author=OuterRef('author')),
+                         'author')
+                + count_of(ArchivedPost.objects.filter(
+                    author=OuterRef('author')), 'author')),
+        ).first()
+        if post is not None:
+            return post
+    return None
+
+
+def page_post(request, author, post_id):
+    """Живой или архивный пост автора с числом комментариев и постов
+    автора одним запросом к шарду (для архивного - двумя) или None."""
+    return once(request, ('post', author.pk, post_id),
+                lambda: find_post(author, post_id))
+
+
+def feed_state(querysets):
+    """Число постов и время последней правки по всем шардам."""
+    count, updated = 0, None
+    for queryset in querysets:
+        state = queryset.aggregate(count=Count('pk'), updated=Max('updated'))
+        count += state['count']
+        if state['updated'] is not None:
+            updated = max(updated or state['updated'], state['updated'])
+    return count, updated
+
+
+def author_state(request, author):
+    return (author.username, author.first_name, author.last_name,
+            author.follower_count, author.following_count,
+            author.pk in followed_ids(request.user))
+
+
+def index_validators(request):
+    return feed_state(Post.objects.using(alias) for alias in shards())
+
+
+def group_validators(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'pk', 'title', 'description').first()
+    if group is None:
+        return None
+    return (group,) + feed_state(
+        Post.objects.using(alias).filter(group_id=group[0])
+        for alias in shards())
+
+
+def profile_validators(request, username):
+    author = page_author(request, username)
+    if author is None:
+        return None
+    archived = author_archive(author).aggregate(
+        count=Count('pk'), archived=Max('archived'))
+    return (author_state(request, author)
+            + feed_state([author_posts(author)])
+            + tuple(archived.values()))
+
+
+def post_validators(request, username, post_id):
+    author = page_author(request, username)
+    if author is None:
+        return None
+    post = page_post(request, author, post_id)
+    if post is None:
+        return None
+    return author_state(request, author) + (
+        post.pk, getattr(post, 'updated', None),
+        getattr(post, 'archived', None), post.comment_count,
+        post.last_comment, post.post_count)
@@ -0,0 +1,89 @@
+"""Курсорная (keyset) пагинация по паре (дата, id).
+
+Курсор - строка "<микросекунды>.<id>" последней показанной записи,
+следующая порция - записи строго старше неё. В отличие от OFFSET
+стоимость запроса не растёт с номером страницы.
+"""
+import datetime as dt
+import heapq
+from itertools import islice
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .sharding import ShardedFeed, feed_key
+
+EPOCH = dt.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(moment, pk):
+    micros = (moment - EPOCH) // dt.timedelta(microseconds=1)
+    return f'{micros}.{pk}'
+
+
+def decode_cursor(token):
+    """(дата, id) из курсора или None для пустого и испорченного."""
+    try:
+        micros, pk = token.split('.')
+        return EPOCH + dt.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def older_than(field, cursor):
+    moment, pk = cursor
+    return (Q(**{f'{field}__lt': moment})
+            | Q(**{field: moment, 'pk__lt': pk}))
+
+
+def newer_than(field, cursor):
+    moment, pk = cursor
+    return (Q(**{f'{field}__gt': moment})
+            | Q(**{field: moment, 'pk__gt': pk}))
+
+
+def keyset_page(queryset, field, token, size):
+    """Порция из size записей после курсора token (новые сначала).
+
+    Возвращает QuerySet порции и курсор следующей порции или None.
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    cursor = decode_cursor(token) if token else None
+    if cursor is not None:
+        queryset = queryset.filter(older_than(field, cursor))
+    page = queryset[:size]
+    items = list(page)
+    if len(items) < size:
+        return page, None
+    last = items[-1]
+    cursor = (getattr(last, field), last.pk)
+    if not queryset.filter(older_than(field, cursor)).exists():
+        return page, None
+    return page, encode_cursor(*cursor)
+
+
+def feed_page(feed, token, size):
+    """Порция ленты после курсора token: каждый шард отдаёт не больше
+    size + 1 постов по индексу pub_date, дальше слияние как в
+    ShardedFeed. Возвращает список постов и следующий курсор."""
+    querysets = feed.querysets if isinstance(feed, ShardedFeed) else [feed]
+    cursor = decode_cursor(token)
+    parts = []
+    for queryset in querysets:
+        queryset = queryset.order_by('-pub_date', '-pk')
+        if cursor is not None:
+            queryset = queryset.filter(older_than('pub_date', cursor))
+        parts.append(list(queryset[:size + 1]))
+    posts = list(islice(heapq.merge(*parts, key=feed_key, reverse=True),
+                        size + 1))
+    if len(posts) <= size:
+        return posts, None
+    posts = posts[:size]
+    return posts, encode_cursor(*feed_key(posts[-1]))
+
+
+def page_cursor(page):
+    """Курсор для подгрузки ленты после страницы page Paginator."""
+    if not page.has_next():
+        return None
+    return encode_cursor(*feed_key(page[-1]))
@@ -0,0 +1,90 @@
+"""Удаление пользователя в два этапа.
+
+schedule_user_deletion сразу блокирует вход и скрывает контент,
+фоновая задача потом удаляет строки небольшими транзакциями,
+чтобы не держать блокировку записи SQLite на всё каскадное удаление.
+"""
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from jobs.queue import enqueue
+from sorl.thumbnail import delete as delete_thumbnails
+from users.auth import forget_user
+
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Post,
+                     User, UserDeletion, UserExport)
+from .sharding import shards
+
+POST_MODELS = (Post, ArchivedPost)
+COMMENT_MODELS = (Comment, ArchivedComment)
+
+
+def schedule_user_deletion(user):
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        UserDeletion.objects.get_or_create(user_id=user.pk)
+    # update() мимо сигналов, закэшированный пользователь ещё активен
+    forget_user(user)
+    for alias in shards():
+        for model in POST_MODELS + COMMENT_MODELS:
+            model.all_objects.using(alias).filter(author_id=user.pk).update(
+                hidden=True)
+        # чужие посты теряют комментарии, их ETag в лентах должен смениться
+        Post.all_objects.using(alias).filter(
+            comments__author_id=user.pk).update(updated=timezone.now())
+    enqueue('posts.tasks.delete_user', user.pk, key=f'delete_user:{user.pk}')
+
+
+def delete_in_batches(queryset, batch_size, on_batch=None):
+    deleted = 0
+    while True:
+        batch = list(queryset[:batch_size])
+        if not batch:
+            return deleted
+        with transaction.atomic(using=queryset.db):
+            queryset.model._base_manager.using(queryset.db).filter(
+                pk__in=[obj.pk for obj in batch]).delete()
+        if on_batch is not None:
+            on_batch(batch)
+        deleted += len(batch)
+
+
+def delete_images(posts):
+    for post in posts:
+        if post.image and default_storage.exists(post.image.name):
+            # вместе с файлом удаляются миниатюры sorl
+            delete_thumbnails(post.image)
+
+
+def delete_user_data(user_id, batch_size=200):
+    for alias in shards():
+        for model in COMMENT_MODELS:
+            objects = model.all_objects.using(alias)
+            # сначала комментарии к постам, чтобы каскад от поста
+            # не тянул их все разом
+            delete_in_batches(
+                objects.filter(post__author_id=user_id).only('pk'),
+                batch_size)
+            delete_in_batches(
+                objects.filter(author_id=user_id).only('pk'), batch_size)
+        for model in POST_MODELS:
+            delete_in_batches(
+                model.all_objects.using(alias).filter(author_id=user_id)
+                .only('pk', 'image'),
+                batch_size, on_batch=delete_images)
+    delete_in_batches(
+        Follow.objects.filter(Q(user_id=user_id) | Q(author_id=user_id))
+        .only('pk'),
+        batch_size)
+    User.objects.filter(pk=user_id).delete()
+    UserExport.objects.filter(user_id=user_id).delete()
+    UserDeletion.objects.filter(user_id=user_id).delete()
+
+
+def process_deletions(batch_size=200):
+    user_ids = list(UserDeletion.objects.order_by('requested').values_list(
+        'user_id', flat=True))
+    for user_id in user_ids:
+        delete_user_data(user_id, batch_size)
+    return len(user_ids)
@@ -0,0 +1,372 @@
+"""Потоковая выгрузка и загрузка данных в JSONL/CSV,
+выгрузка всех данных пользователя в NDJSON или ZIP.
+
+Связи сохраняются через естественные ключи: пользователи по username,
+группы по slug. Посты сохраняют свой id, комментарии ссылаются на него
+и на автора поста, чтобы попасть на нужный шард.
+"""
+import contextlib
+import csv
+import datetime as dt
+import json
+import zipfile
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .archive import author_archive
+from .models import (ArchivedComment, ArchivedPost, Comment, Follow, Group,
+                     Post, User, UserExport)
+from .sharding import author_posts, reserve_post_ids, shard_for, shards
+
+FIELDS = {
+    'group': ['slug', 'title', 'description'],
+    'post': ['id', 'author', 'group', 'pub_date', 'text', 'image'],
+    'comment': ['id', 'post', 'post_author', 'author', 'created', 'text'],
+    'follow': ['user', 'author'],
+    'archivedpost': ['id', 'author', 'group', 'pub_date', 'text', 'image',
+                     'archived'],
+    'archivedcomment': ['id', 'post', 'post_author', 'author', 'created',
+                        'text'],
+}
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def usernames(ids):
+    return dict(User.objects.filter(pk__in=ids).values_list('pk', 'username'))
+
+
+def user_ids(names):
+    return dict(User.objects.filter(username__in=names)
+                .values_list('username', 'pk'))
+
+
+def group_rows(queryset, chunk_size=2000):
+    rows = queryset.order_by('pk').values(*FIELDS['group'])
+    yield from rows.iterator(chunk_size=chunk_size)
+
+
+def post_rows(queryset, chunk_size=2000):
+    archived = queryset.model is ArchivedPost
+    fields = ['id', 'author_id', 'group_id', 'pub_date', 'text', 'image']
+    if archived:
+        fields.append('archived')
+    rows = queryset.order_by('pk').values(*fields)
+    for chunk in chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+        authors = usernames({row['author_id'] for row in chunk})
+        slugs = dict(Group.objects.filter(
+            pk__in={row['group_id'] for row in chunk}
+        ).values_list('pk', 'slug'))
+        for row in chunk:
+            result = {
+                'id': row['id'],
+                'author': authors.get(row['author_id']),
+                'group': slugs.get(row['group_id']),
+                'pub_date': row['pub_date'].isoformat(),
+                'text': row['text'],
+                'image': row['image'] or '',
+            }
+            if archived:
+                result['archived'] = row['archived'].isoformat()
+            yield result
+
+
+def comment_rows(queryset, chunk_size=2000):
+    rows = queryset.order_by('pk').values(
+        'id', 'post_id', 'post__author_id', 'author_id', 'created', 'text')
+    for chunk in chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+        authors = usernames(
+            {row['author_id'] for row in chunk}
+            | {row['post__author_id'] for row in chunk})
+        for row in chunk:
+            yield {
+                'id': row['id'],
+                'post': row['post_id'],
+                'post_author': authors.get(row['post__author_id']),
+                'author': authors.get(row['author_id']),
+                'created': row['created'].isoformat(),
+                'text': row['text'],
+            }
+
+
+def follow_rows(queryset, chunk_size=2000):
+    rows = queryset.order_by('pk').values_list('user_id', 'author_id')
+    for chunk in chunks(rows.iterator(chunk_size=chunk_size), chunk_size):
+        names = usernames({pk for pair in chunk for pk in pair})
+        for user_id, author_id in chunk:
+            yield {'user': names.get(user_id), 'author': names.get(author_id)}
+
+
+def export_rows(kind, chunk_size=2000):
+    if kind == 'group':
+        return group_rows(Group.objects.all(), chunk_size)
+    if kind == 'follow':
+        return follow_rows(Follow.objects.all(), chunk_size)
+    model, rows = {
+        'post': (Post, post_rows),
+        'comment': (Comment, comment_rows),
+        'archivedpost': (ArchivedPost, post_rows),
+        'archivedcomment': (ArchivedComment, comment_rows),
+    }[kind]
+    return (row for alias in shards()
+            for row in rows(model.objects.using(alias), chunk_size))
+
+
+def write_jsonl(rows, stream):
+    count = 0
+    for row in rows:
+        stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(rows, kind, stream):
+    writer = csv.DictWriter(stream, FIELDS[kind])
+    writer.writeheader()
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def read_jsonl(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+@contextlib.contextmanager
+def keep_timestamps(*fields):
+    """Не даёт auto_now и auto_now_add затереть даты из выгрузки."""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def new_objects(objects, queryset):
+    """Объекты, чьих id ещё нет в queryset."""
+    taken = set(queryset.filter(pk__in=[obj.pk for obj in objects])
+                .values_list('pk', flat=True))
+    return [obj for obj in objects if obj.pk not in taken]
+
+
+def import_groups(batch):
+    taken = set(Group.objects.filter(
+        slug__in=[row['slug'] for row in batch]).values_list(
+        'slug', flat=True))
+    groups = [Group(**{name: row[name] for name in FIELDS['group']})
+              for row in batch if row['slug'] not in taken]
+    Group.objects.bulk_create(groups, ignore_conflicts=True)
+    return len(groups)
+
+
+def import_posts(batch, model=Post):
+    authors = user_ids({row['author'] for row in batch})
+    groups = dict(Group.objects.filter(
+        slug__in={row['group'] for row in batch if row['group']}
+    ).values_list('slug', 'pk'))
+    by_shard = {}
+    for row in batch:
+        author_id = authors.get(row['author'])
+        if author_id is None:
+            continue
+        post = model(
+            id=int(row['id']),
+            author_id=author_id,
+            group_id=groups.get(row['group']),
+            pub_date=parse_datetime(row['pub_date']),
+            text=row['text'],
+            image=row['image'] or None,
+        )
+        if model is ArchivedPost:
+            post.archived = parse_datetime(row['archived'])
+        by_shard.setdefault(shard_for(author_id), []).append(post)
+    imported = 0
+    for alias, posts in by_shard.items():
+        posts = new_objects(posts, model.all_objects.using(alias))
+        model.objects.using(alias).bulk_create(posts, ignore_conflicts=True)
+        imported += len(posts)
+    # id из выгрузки не должны выдаваться новым постам
+    reserve_post_ids(max((int(row['id']) for row in batch), default=None))
+    return imported
+
+
+def import_archived_posts(batch):
+    return import_posts(batch, ArchivedPost)
+
+
+def import_comments(batch, model=Comment):
+    authors = user_ids(
+        {row['author'] for row in batch}
+        | {row['post_author'] for row in batch})
+    by_shard = {}
+    for row in batch:
+        author_id = authors.get(row['author'])
+        post_author_id = authors.get(row['post_author'])
+        if author_id is None or post_author_id is None:
+            continue
+        by_shard.setdefault(shard_for(post_author_id), []).append(model(
+            id=int(row['id']),
+            post_id=int(row['post']),
+            author_id=author_id,
+            created=parse_datetime(row['created']),
+            text=row['text'],
+        ))
+    imported = 0
+    for alias, comments in by_shard.items():
+        comments = new_objects(comments, model.all_objects.using(alias))
+        model.objects.using(alias).bulk_create(
+            comments, ignore_conflicts=True)
+        imported += len(comments)
+    return imported
+
+
+def import_archived_comments(batch):
+    return import_comments(batch, ArchivedComment)
+
+
+def import_follows(batch):
+    ids = user_ids({row['user'] for row in batch}
+                   | {row['author'] for row in batch})
+    pairs = {(ids[row['user']], ids[row['author']]) for row in batch
+             if row['user'] in ids and row['author'] in ids}
+    pairs -= set(Follow.objects.filter(
+        user_id__in={user for user, _ in pairs},
+        author_id__in={author for _, author in pairs},
+    ).values_list('user_id', 'author_id'))
+    Follow.objects.bulk_create(
+        [Follow(user_id=user, author_id=author) for user, author in pairs],
+        ignore_conflicts=True)
+    return len(pairs)
+
+
+IMPORTERS = {
+    'group': import_groups,
+    'post': import_posts,
+    'comment': import_comments,
+    'follow': import_follows,
+    'archivedpost': import_archived_posts,
+    'archivedcomment': import_archived_comments,
+}
+
+
+def import_rows(kind, rows, batch_size=1000):
+    """Загружает строки пачками, отдавая для каждой пачки пару
+    (загружено, пропущено): пропускаются уже существующие строки и
+    строки с неизвестным автором."""
+    importer = IMPORTERS[kind]
+    with keep_timestamps(Post._meta.get_field('pub_date'),
+                         Comment._meta.get_field('created'),
+                         ArchivedPost._meta.get_field('archived')):
+        for batch in chunks(rows, batch_size):
+            imported = importer(batch)
+            yield imported, len(batch) - imported
+
+
+def user_posts(user, chunk_size=500):
+    yield from post_rows(author_posts(user), chunk_size)
+    yield from post_rows(author_archive(user), chunk_size)
+
+
+def user_comments(user, chunk_size=500):
+    for alias in shards():
+        for model in (Comment, ArchivedComment):
+            yield from comment_rows(
+                model.objects.using(alias).filter(author=user), chunk_size)
+
+
+def stream_ndjson(user):
+    for kind, rows in (('post', user_posts(user)),
+                       ('comment', user_comments(user))):
+        for row in rows:
+            row['type'] = kind
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+class _Pipe:
+    """Приёмник для ZipFile, из которого готовые байты забираются
+    по мере записи архива."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def stream_zip(user, chunk_size=500):
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, rows in (('posts.ndjson', user_posts(user, chunk_size)),
+                           ('comments.ndjson', user_comments(user,
+                                                             chunk_size))):
+            with archive.open(name, 'w', force_zip64=True) as dest:
+                for row in rows:
+                    dest.write(
+                        json.dumps(row, ensure_ascii=False).encode() + b'\n')
+                    yield pipe.pop()
+        for row in user_posts(user, chunk_size):
+            if not row['image'] or not default_storage.exists(row['image']):
+                continue
+            with default_storage.open(row['image']) as source, \
+                    archive.open(row['image'], 'w', force_zip64=True) as dest:
+                for chunk in source.chunks():
+                    dest.write(chunk)
+                    yield pipe.pop()
+    yield pipe.pop()
+
+
+def claim_export(user_id, interval):
+    """Отмечает начало выгрузки в базе, которую видят все процессы.
+    Возвращает время начала или None, если прошлая выгрузка началась
+    меньше interval секунд назад."""
+    now = timezone.now()
+    _, created = UserExport.objects.get_or_create(
+        user_id=user_id, defaults={'started': now})
+    if not created and not UserExport.objects.filter(
+            user_id=user_id,
+            started__lte=now - dt.timedelta(seconds=interval),
+    ).update(started=now):
+        return None
+    return now
+
+
+def release_on_failure(stream, user_id, started):
+    """Отдаёт stream; если выгрузка оборвалась, попытка не засчитывается."""
+    finished = False
+    try:
+        yield from stream
+        finished = True
+    finally:
+        if not finished:
+            UserExport.objects.filter(
+                user_id=user_id, started=started).delete()
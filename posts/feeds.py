@@ -0,0 +1,167 @@
+"""RSS и Atom для ленты сайта, групп и авторов.
+
+Лента - последние SYNDICATION_ITEMS постов, по LIMIT-запросу на шард
+по индексу pub_date. Готовый XML кэшируется под ключом с отметкой
+ленты из watermarks: новый пост сдвигает отметку, и следующий запрос
+строит XML заново. Правки постов видны через SYNDICATION_CACHE_TIMEOUT.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.http import http_date, quote_etag
+from django.utils.text import Truncator
+
+from . import watermarks
+from .cards import load_relations
+from .cursors import feed_page
+from .models import Group, Post, User
+from .sharding import shard_for, sharded
+
+KEY = 'syndication:{}:{}'
+
+
+class PostsFeed(Feed):
+    def timeline(self, obj):
+        """Посты ленты; по умолчанию все посты сайта."""
+        return sharded(Post.objects.all())
+
+    def items(self, obj):
+        posts, _ = feed_page(self.timeline(obj), None, getattr(
+            settings, 'SYNDICATION_ITEMS', 20))
+        load_relations(posts)
+        return posts
+
+    def subtitle(self, obj):
+        return self._get_dynamic_attr('description', obj)
+
+    def item_title(self, post):
+        return Truncator(post.text).words(8)
+
+    def item_description(self, post):
+        return post.text
+
+    def item_link(self, post):
+        return reverse('post_view', args=[post.author.username, post.pk])
+
+    def item_author_name(self, post):
+        return post.author.get_full_name() or post.author.username
+
+    def item_author_link(self, post):
+        return reverse('profile', args=[post.author.username])
+
+    def item_pubdate(self, post):
+        return post.pub_date
+
+    def item_updateddate(self, post):
+        return post.updated
+
+    def item_categories(self, post):
+        return [post.group.title] if post.group else []
+
+
+class LatestPostsFeed(PostsFeed):
+    title = 'Yatube: последние записи'
+    description = 'Новые записи всех авторов'
+
+    def mark(self):
+        return watermarks.index_feed()
+
+    def link(self):
+        return reverse('index')
+
+
+class GroupPostsFeed(PostsFeed):
+    def mark(self, slug):
+        return watermarks.group_feed(slug)
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, group):
+        return f'Yatube: {group.title}'
+
+    def description(self, group):
+        return group.description
+
+    def link(self, group):
+        return reverse('group_posts', args=[group.slug])
+
+    def timeline(self, group):
+        return sharded(Post.objects.filter(group=group))
+
+
+class AuthorPostsFeed(PostsFeed):
+    def mark(self, username):
+        author = User.objects.filter(username=username).values_list(
+            'pk', flat=True).first()
+        return watermarks.author_feed(author) if author else None
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, author):
+        return f'Yatube: {author.get_full_name() or author.username}'
+
+    def description(self, author):
+        return f'Записи пользователя @{author.username}'
+
+    def link(self, author):
+        return reverse('profile', args=[author.username])
+
+    def timeline(self, author):
+        return Post.objects.using(shard_for(author.pk)).filter(
+            author=author)
+
+
+def atom(feed_class):
+    return type(feed_class.__name__.replace('Feed', 'AtomFeed'),
+                (feed_class,), {'feed_type': Atom1Feed})
+
+
+def cached(feed):
+    """View ленты feed с кэшем XML и ответами 304 по ETag и
+    Last-Modified. Ключ кэша меняется вместе с отметкой ленты."""
+    def view(request, **kwargs):
+        marked = feed.mark(**kwargs)
+        if marked is None:
+            return feed(request, **kwargs)
+        name, _ = marked
+        mark = watermarks.marks([marked])[name]
+        key = KEY.format(request.path, mark)
+        entry = cache.get(key)
+        if entry is None:
+            response = feed(request, **kwargs)
+            if response.status_code != 200:
+                return response
+            # XML не менялся с момента построения, это и есть
+            # его Last-Modified
+            entry = (response.content, response['Content-Type'],
+                     int(time.time()))
+            cache.set(key, entry, getattr(
+                settings, 'SYNDICATION_CACHE_TIMEOUT', 10 * 60))
+        content, content_type, timestamp = entry
+        etag = quote_etag(hashlib.md5(content).hexdigest())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timestamp)
+        return response
+    return view
+
+
+latest_rss = cached(LatestPostsFeed())
+latest_atom = cached(atom(LatestPostsFeed)())
+group_rss = cached(GroupPostsFeed())
+group_atom = cached(atom(GroupPostsFeed)())
+author_rss = cached(AuthorPostsFeed())
+author_atom = cached(atom(AuthorPostsFeed)())
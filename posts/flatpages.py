@@ -0,0 +1,81 @@
+"""Закэшированные flatpages.
+
+Страница ищется в кэше, а для анонимов в кэше лежит и готовый HTML:
+меню в base.html зависит от пользователя, поэтому вошедшим страница
+рендерится заново, но без запросов к FlatPage. Все ключи содержат
+поколение, которое меняют сигналы сохранения и удаления FlatPage.
+Смену поколения в кэше процесса видит только он сам, поэтому без
+общего кэша страницы живут не дольше LOCAL_CACHE_TIMEOUT.
+"""
+import uuid
+
+from django.conf import settings
+from django.contrib.flatpages import views
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sites.shortcuts import get_current_site
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from yatube import caches
+
+GENERATION = 'flatpages:generation'
+KEY = 'flatpage:{}:{}:{}'
+
+
+def timeout():
+    return caches.timeout('FLATPAGE_CACHE_TIMEOUT', None)
+
+
+def generation():
+    value = cache.get(GENERATION)
+    if value is None:
+        cache.add(GENERATION, uuid.uuid4().hex, timeout())
+        value = cache.get(GENERATION)
+    return value
+
+
+@receiver(post_save, sender=FlatPage, dispatch_uid='flatpages_cache')
+@receiver(post_delete, sender=FlatPage, dispatch_uid='flatpages_cache')
+@receiver(m2m_changed, sender=FlatPage.sites.through,
+          dispatch_uid='flatpages_cache')
+def invalidate(**kwargs):
+    cache.set(GENERATION, uuid.uuid4().hex, timeout())
+
+
+def find(url, site_id):
+    """FlatPage по адресу или None; отсутствие тоже кэшируется."""
+    key = KEY.format(generation(), site_id, url)
+    page = cache.get(key)
+    if page is None:
+        page = FlatPage.objects.filter(url=url, sites=site_id).first()
+        cache.set(key, page or False, timeout())
+    return page or None
+
+
+def flatpage(request, url):
+    """Как django.contrib.flatpages.views.flatpage, но из кэша."""
+    if not url.startswith('/'):
+        url = '/' + url
+    site_id = get_current_site(request).id
+    page = find(url, site_id)
+    if page is None:
+        # 404 или редирект на адрес со слэшем
+        return views.flatpage(request, url)
+    if request.user.is_authenticated or page.registration_required:
+        return views.render_flatpage(request, page)
+    key = KEY.format(generation(), site_id, url) + ':html'
+    cached = cache.get(key)
+    if cached is None:
+        response = views.render_flatpage(request, page)
+        cached = response.content, response['Content-Type']
+        cache.set(key, cached, timeout())
+    content, content_type = cached
+    return HttpResponse(content, content_type=content_type)
+
+
+def public_urls():
+    """Адреса страниц текущего сайта для прогрева."""
+    return list(FlatPage.objects.filter(
+        sites=settings.SITE_ID, registration_required=False,
+    ).values_list('url', flat=True))
@@ -0,0 +1,78 @@
+"""Авторы, на которых подписан пользователь.
+
+В кэше лежит отсортированный массив id (array, 8 байт на автора), за
+запрос он один раз разворачивается в frozenset на объекте
+пользователя: проверки подписки в профиле, на странице поста и в
+ленте подписок - поиск в памяти. Создание и удаление Follow сбрасывают
+закэшированный массив, и он заново читается из базы: правка на месте
+(прочитать, изменить, записать) теряла бы одновременные подписки.
+"""
+import array
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from yatube import caches
+
+from .models import Follow
+
+KEY = 'followed:{}'
+
+
+def timeout():
+    return caches.timeout('FOLLOW_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def pack(ids):
+    return array.array('q', sorted(ids)).tobytes()
+
+
+def unpack(packed):
+    ids = array.array('q')
+    ids.frombytes(packed)
+    return ids
+
+
+def followed_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    ids = getattr(user, '_followed_ids', None)
+    if ids is None:
+        key = KEY.format(user.pk)
+        packed = cache.get(key)
+        if packed is None:
+            packed = pack(Follow.objects.filter(user_id=user.pk).values_list(
+                'author_id', flat=True))
+            cache.set(key, packed, timeout())
+        ids = user._followed_ids = frozenset(unpack(packed))
+    return ids
+
+
+def forget(user_id):
+    key = KEY.format(user_id)
+    cache.delete(key)
+    # запрос, прочитавший подписки до фиксации, мог положить их обратно
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+# сигналы ловят и подписки из админки, и удаление пользователя
+@receiver(post_save, sender=Follow, dispatch_uid='followed_ids')
+def followed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        forget(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow, dispatch_uid='followed_ids')
+def unfollowed(sender, instance, **kwargs):
+    forget(instance.user_id)
+
+
+def follow(user, author):
+    Follow.objects.get_or_create(user=user, author=author)
+    user._followed_ids = None
+
+
+def unfollow(user, author):
+    Follow.objects.filter(user=user, author=author).delete()
+    user._followed_ids = None
@@ -0,0 +1,24 @@
+import datetime as dt
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.archive import archive_cutoff, archive_posts
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые посты и их комментарии в архивные таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help='Возраст поста в днях, по умолчанию POST_ARCHIVE_AFTER_DAYS')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options['days'] is None:
+            cutoff = archive_cutoff()
+        else:
+            cutoff = timezone.now() - dt.timedelta(days=options['days'])
+        moved = archive_posts(cutoff, options['batch_size'])
+        self.stdout.write(f'В архив перенесено постов: {moved}')
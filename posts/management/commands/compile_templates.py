@@ -0,0 +1,93 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.template import Engine, RequestContext, engines
+from django.test import RequestFactory
+
+from posts.forms import PostForm
+from posts.models import Group, Post
+from posts.sharding import sharded
+from yatube.warmup import compile_templates, project_template_dirs
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+class Command(BaseCommand):
+    help = ('Проверяет и компилирует шаблоны проекта, с --benchmark '
+            'сравнивает время рендера страниц без кэша шаблонов и с ним')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--benchmark', action='store_true')
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count, errors = compile_templates(project_template_dirs())
+        elapsed = (time.perf_counter() - started) * 1000
+        for name, error in errors:
+            self.stderr.write(f'{name}: {error}')
+        self.stdout.write(
+            f'Шаблонов: {count}, ошибок: {len(errors)}, {elapsed:.0f}ms')
+        if errors:
+            raise CommandError('Есть шаблоны с ошибками')
+        if options['benchmark']:
+            self.benchmark(options['repeat'])
+
+    def pages(self):
+        posts = list(sharded(Post.objects.select_related(
+            'author', 'group').all())[:10])
+        if not posts:
+            raise CommandError('Для замера нужен хотя бы один пост')
+        page = Paginator(posts, 10).get_page(1)
+        feed = {'page': page, 'paginator': page.paginator}
+        group = Group.objects.first()
+        pages = [
+            ('index.html', feed),
+            ('profile.html', dict(feed, author=posts[0].author,
+                                  follower_count=0, following_count=0,
+                                  post_count=len(posts))),
+            ('new.html', {'form': PostForm(), 'title_str': 'Новая запись',
+                          'header_str': 'Новая запись',
+                          'button_str': 'Опубликовать'}),
+        ]
+        if group is not None:
+            pages.append(('group.html', dict(feed, group=group)))
+        return pages
+
+    def benchmark(self, repeat):
+        source = engines.all()[0].engine
+        options = {
+            'dirs': source.dirs,
+            'context_processors': source.context_processors,
+            'libraries': source.libraries,
+            'builtins': source.builtins,
+        }
+        plain = Engine(loaders=LOADERS, **options)
+        cached = Engine(
+            loaders=[('django.template.loaders.cached.Loader', LOADERS)],
+            **options)
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        pages = self.pages()
+        for name, context in pages:
+            timings = []
+            for engine in (plain, cached):
+                # первый рендер заполняет кэш и прогревает запросы к базе
+                engine.get_template(name).render(
+                    RequestContext(request, context))
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    engine.get_template(name).render(
+                        RequestContext(request, context))
+                timings.append(
+                    (time.perf_counter() - started) / repeat * 1000)
+            self.stdout.write(
+                f'{name:15} без кэша {timings[0]:7.2f}ms  '
+                f'с кэшем {timings[1]:7.2f}ms  '
+                f'x{timings[0] / timings[1]:.1f}')
+
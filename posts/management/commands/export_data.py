@@ -0,0 +1,39 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.dump import FIELDS, export_rows, write_csv, write_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Потоково выгружает группы, посты и комментарии, в том числе '
+            'архивные, или подписки')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(FIELDS))
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            default='jsonl')
+        parser.add_argument('--output', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        rows = export_rows(kind, options['chunk_size'])
+        started = time.monotonic()
+        if options['output'] == '-':
+            count = self.write(rows, kind, options['format'], self.stdout)
+        else:
+            with open(options['output'], 'w', encoding='utf-8',
+                      newline='') as stream:
+                count = self.write(rows, kind, options['format'], stream)
+        elapsed = time.monotonic() - started
+        sys.stderr.write(
+            f'{kind}: {count} строк за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-6):.0f} строк/с)\n')
+
+    def write(self, rows, kind, fmt, stream):
+        if fmt == 'csv':
+            return write_csv(rows, kind, stream)
+        return write_jsonl(rows, stream)
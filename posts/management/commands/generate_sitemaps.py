@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts.sitemaps import render_chunk, sections
+
+
+class Command(BaseCommand):
+    help = ('Строит и кэширует куски карты сайта; неизменившиеся '
+            'куски берутся из кэша')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--section', action='append',
+                            help='Только указанные разделы')
+
+    def handle(self, *args, **options):
+        chunks = 0
+        for name, section in sections().items():
+            if options['section'] and name not in options['section']:
+                continue
+            for number in range(section().chunks()):
+                render_chunk(name, number)
+                chunks += 1
+        self.stdout.write(f'Кусков карты сайта: {chunks}')
@@ -0,0 +1,49 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.dump import FIELDS, import_rows, read_csv, read_jsonl
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает выгрузку export_data пачками bulk_create, '
+            'уже существующие строки пропускаются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(FIELDS))
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            default='jsonl')
+        parser.add_argument('--input', default='-',
+                            help='Файл с выгрузкой, по умолчанию stdin')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--progress-every', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        if options['input'] == '-':
+            self.load(sys.stdin, options)
+        else:
+            with open(options['input'], encoding='utf-8',
+                      newline='') as stream:
+                self.load(stream, options)
+
+    def load(self, stream, options):
+        kind = options['kind']
+        reader = read_csv if options['format'] == 'csv' else read_jsonl
+        started = time.monotonic()
+        count = skipped = reported = 0
+        for imported, missed in import_rows(kind, reader(stream),
+                                            options['batch_size']):
+            count += imported
+            skipped += missed
+            if count + skipped - reported >= options['progress_every']:
+                reported = count + skipped
+                self.report(kind, count, skipped, started)
+        self.report(kind, count, skipped, started)
+
+    def report(self, kind, count, skipped, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{kind}: загружено {count}, пропущено {skipped} строк '
+            f'за {elapsed:.1f} с '
+            f'({(count + skipped) / max(elapsed, 1e-6):.0f} строк/с)')
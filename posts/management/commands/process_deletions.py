@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.deletion import process_deletions
+
+
+class Command(BaseCommand):
+    help = 'Удаляет данные пользователей, поставленных в очередь на удаление'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        processed = process_deletions(options['batch_size'])
+        self.stdout.write(f'Удалено пользователей: {processed}')
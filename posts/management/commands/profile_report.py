@@ -0,0 +1,66 @@
+import io
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube.profiling import profile_token
+
+
+class Command(BaseCommand):
+    help = ('Объединяет профили из PROFILE_DIR: свёрнутые стеки - в один '
+            'файл для flamegraph.pl или speedscope, pstats - в сводку')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--view', action='append', default=[],
+                            help='Имя URL, можно указать несколько раз')
+        parser.add_argument('--output', help='Файл для свёрнутых стеков')
+        parser.add_argument('--top', type=int, default=30,
+                            help='Сколько строк pstats выводить')
+        parser.add_argument('--token', action='store_true',
+                            help='Выдать токен для заголовка X-Profile-Token')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(profile_token())
+            return
+        directory = getattr(settings, 'PROFILE_DIR', None)
+        if not directory or not os.path.isdir(directory):
+            raise CommandError('PROFILE_DIR не задан или пуст')
+        views = options['view'] or sorted(os.listdir(directory))
+        stacks = Counter()
+        prof_files = []
+        for view in views:
+            path = os.path.join(directory, view)
+            if not os.path.isdir(path):
+                continue
+            for name in os.listdir(path):
+                filename = os.path.join(path, name)
+                if name.endswith('.prof'):
+                    prof_files.append(filename)
+                elif name.endswith('.folded'):
+                    with open(filename) as stream:
+                        for line in stream:
+                            stack, _, count = line.rstrip().rpartition(' ')
+                            stacks[f'{view};{stack}'] += int(count)
+        if stacks:
+            self.write_folded(stacks, options['output'])
+        if prof_files:
+            report = io.StringIO()
+            stats = pstats.Stats(*prof_files, stream=report)
+            stats.sort_stats('cumulative').print_stats(options['top'])
+            self.stdout.write(report.getvalue())
+        self.stderr.write(
+            f'стеков: {len(stacks)}, сэмплов: {sum(stacks.values())}, '
+            f'файлов pstats: {len(prof_files)}')
+
+    def write_folded(self, stacks, output):
+        stream = open(output, 'w') if output else self.stdout
+        try:
+            for stack, count in stacks.most_common():
+                stream.write(f'{stack} {count}\n')
+        finally:
+            if output:
+                stream.close()
@@ -0,0 +1,119 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from posts.dump import keep_timestamps
+from posts.models import ArchivedComment, ArchivedPost, Comment, Post
+from posts.sharding import next_post_id, reserve_post_ids, shard_for, shards
+
+# посты и их комментарии; архив переносится так же, как живые посты
+TABLES = ((Post, Comment), (ArchivedPost, ArchivedComment))
+
+
+class Command(BaseCommand):
+    help = ('Переносит посты, архив и их комментарии на шард автора '
+            'согласно текущему POST_SHARDS')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', action='append', default=[],
+            help='Алиас выводимого из POST_SHARDS шарда, который нужно '
+                 'освободить. Можно указать несколько раз.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        sources = shards() + [
+            alias for alias in options['source'] if alias not in shards()]
+        if not options['dry_run']:
+            # id, выданные автоинкрементом шардов до общей
+            # последовательности, больше не выдаются
+            reserve_post_ids(max(
+                (model.all_objects.using(alias).aggregate(
+                    top=Max('pk'))['top'] or 0
+                 for alias in sources for model in (Post, ArchivedPost)),
+                default=0))
+        # перенос не правка: даты постов и комментариев сохраняются
+        with keep_timestamps(Post._meta.get_field('pub_date'),
+                             Post._meta.get_field('updated'),
+                             Comment._meta.get_field('created'),
+                             ArchivedPost._meta.get_field('archived')):
+            for alias in sources:
+                moved = remapped = 0
+                for post_model, comment_model in TABLES:
+                    counts = self.drain(
+                        alias, post_model, comment_model,
+                        options['batch_size'], options['dry_run'])
+                    moved += counts[0]
+                    remapped += counts[1]
+                self.stdout.write(
+                    f'{alias}: перенесено {moved}, с новым id {remapped}')
+
+    def drain(self, alias, post_model, comment_model, batch_size, dry_run):
+        moved = remapped = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                post_model.all_objects.using(alias)
+                .filter(pk__gt=last_pk)
+                .order_by('pk')[:batch_size]
+            )
+            if not batch:
+                return moved, remapped
+            last_pk = batch[-1].pk
+            by_target = {}
+            for post in batch:
+                target = shard_for(post.author_id)
+                if target != alias:
+                    by_target.setdefault(target, []).append(post)
+            for target, posts in by_target.items():
+                moved += len(posts)
+                if not dry_run:
+                    remapped += self.move(
+                        alias, target, posts, post_model, comment_model)
+
+    def move(self, source, target, posts, post_model, comment_model):
+        """Переносит посты с комментариями, возвращает число постов,
+        получивших новый id."""
+        # target фиксируется раньше source: при сбое между фиксациями
+        # пост окажется на обоих шардах, а не потеряется
+        with transaction.atomic(using=source), \
+                transaction.atomic(using=target):
+            ids = [post.pk for post in posts]
+            taken = {
+                pk: (author_id, pub_date)
+                for pk, author_id, pub_date
+                in post_model.all_objects.using(target).filter(pk__in=ids)
+                .values_list('pk', 'author_id', 'pub_date')
+            }
+            # посты и архив делят один ряд id: id, занятый другой
+            # таблицей, тоже конфликт
+            other = ArchivedPost if post_model is Post else Post
+            for pk in other.all_objects.using(target).filter(
+                    pk__in=ids).values_list('pk', flat=True):
+                taken.setdefault(pk, None)
+            new_ids = {}
+            copied = set()
+            for post in posts:
+                if post.pk not in taken:
+                    continue
+                if taken[post.pk] == (post.author_id, post.pub_date):
+                    # уже перенесён прерванным запуском
+                    copied.add(post.pk)
+                else:
+                    # id занят постом, созданным на target до общей
+                    # последовательности, - выдаём новый
+                    new_ids[post.pk] = post.pk = next_post_id()
+            comments = list(
+                comment_model.all_objects.using(source)
+                .filter(post_id__in=set(ids) - copied))
+            # id постов входят в URL и сохраняются, id комментариев - нет
+            for comment in comments:
+                comment.pk = None
+                comment.post_id = new_ids.get(comment.post_id,
+                                              comment.post_id)
+            post_model.all_objects.using(target).bulk_create(
+                [post for post in posts if post.pk not in copied])
+            comment_model.all_objects.using(target).bulk_create(comments)
+            post_model.all_objects.using(source).filter(pk__in=ids).delete()
+        return len(new_ids)
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube import querylog
+
+
+class Command(BaseCommand):
+    help = ('Самые тяжёлые SQL-запросы по снимкам процессов из '
+            'METRICS_DIR/queries')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--by', choices=('total', 'p99', 'count'), default='total')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--view', help='Только запросы этого имени URL')
+
+    def handle(self, *args, **options):
+        # у самой команды статистики нет, она читает снимки веб-процессов
+        if not getattr(settings, 'METRICS_DIR', None):
+            raise CommandError('METRICS_DIR не задан: снимков процессов нет')
+        rows = querylog.top(querylog.collect(own=False), options['by'],
+                            options['limit'], options['view'])
+        if not rows:
+            self.stdout.write('Статистики запросов пока нет')
+            return
+        for row in rows:
+            views = ', '.join(
+                f'{name} {total * 1000:.0f}ms'
+                for name, total in row['views'][:3])
+            self.stdout.write(
+                f'{row["total"] * 1000:10.1f}ms total  {row["count"]:7d}x  '
+                f'p99 {row["p99"] * 1000:8.2f}ms  [{views}]\n'
+                f'    {row["sql"]}')
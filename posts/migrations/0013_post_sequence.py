@@ -0,0 +1,42 @@
+# Generated by Django 2.2.6 on 2026-10-19 00:19
+
+from django.core.management.color import no_style
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_sequence(apps, schema_editor):
+    # новые id должны идти после уже выданных автоинкрементом default;
+    # посты остальных шардов учитывает manage.py reshard
+    connection = schema_editor.connection
+    tops = [
+        apps.get_model('posts', name).objects.using(connection.alias)
+        .aggregate(top=Max('pk'))['top']
+        for name in ('Post', 'ArchivedPost')
+    ]
+    tops = [top for top in tops if top]
+    if not tops:
+        return
+    sequence = apps.get_model('posts', 'PostSequence')
+    sequence.objects.using(connection.alias).create(pk=max(tops))
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [sequence]):
+            cursor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_comment_cursor_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostSequence',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop,
+                             hints={'model_name': 'postsequence'}),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-19 00:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserExport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.IntegerField(unique=True)),
+                ('started', models.DateTimeField()),
+            ],
+        ),
+    ]
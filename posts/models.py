@@ -1,9 +1,28 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .sharding import next_post_id
+
 User = get_user_model()
 
 
+class ShardedManager(models.Manager):
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        # без using() шард выбирает роутер по автору из kwargs
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class VisibleManager(ShardedManager):
+    """Скрывает строки, ожидающие удаления."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(hidden=False)
+
+
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Название')
     slug = models.SlugField(unique=True)
@@ -22,39 +41,64 @@ class Post(models.Model):
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True,
+        db_index=True,
     )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
         verbose_name='Автор',
-        related_name='posts'
+        related_name='posts',
+        db_constraint=False,
     )
     group = models.ForeignKey(
         Group,
         on_delete=models.SET_NULL,
         verbose_name='Группа',
         related_name='group',
-        blank=True, null=True
+        blank=True, null=True,
+        db_constraint=False,
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    hidden = models.BooleanField(default=False)
+    # меняется при правке поста и новых комментариях, см. conditional.py
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = VisibleManager()
+    all_objects = ShardedManager()
+
+    is_archived = False
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self.pk = next_post_id()
+            kwargs['force_insert'] = True
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                verbose_name='Автор',
-                               related_name='comments')
+                               related_name='comments',
+                               db_constraint=False)
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
                              related_name='comments')
     text = models.TextField(max_length=300, verbose_name='Текст')
     created = models.DateTimeField(auto_now_add=True)
+    hidden = models.BooleanField(default=False)
+
+    objects = VisibleManager()
+    all_objects = ShardedManager()
 
     class Meta:
         ordering = ['-created']
+        # порции комментариев выбираются по курсору внутри поста
+        indexes = [models.Index(fields=['post', 'created', 'id'],
+                                name='comment_post_cursor')]
 
 
 class Follow(models.Model):
@@ -69,3 +113,74 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("user", "author")
+
+
+class ArchivedPost(models.Model):
+    """Холодная копия Post, id сохраняется."""
+    text = models.TextField(verbose_name='Текст')
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='archived_posts',
+        db_constraint=False,
+    )
+    group = models.ForeignKey(
+        Group,
+        on_delete=models.SET_NULL,
+        verbose_name='Группа',
+        related_name='archived_posts',
+        blank=True, null=True,
+        db_constraint=False,
+    )
+    image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    archived = models.DateTimeField(auto_now_add=True)
+    hidden = models.BooleanField(default=False)
+
+    objects = VisibleManager()
+    all_objects = ShardedManager()
+
+    is_archived = True
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Архивный пост'
+        verbose_name_plural = 'Архивные посты'
+
+
+class ArchivedComment(models.Model):
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               verbose_name='Автор',
+                               related_name='archived_comments',
+                               db_constraint=False)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE,
+                             related_name='comments')
+    text = models.TextField(max_length=300, verbose_name='Текст')
+    created = models.DateTimeField()
+    hidden = models.BooleanField(default=False)
+
+    objects = VisibleManager()
+    all_objects = ShardedManager()
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [models.Index(fields=['post', 'created', 'id'],
+                                name='archived_comment_post_cursor')]
+
+
+class PostSequence(models.Model):
+    """Выданные id постов, живёт только в default."""
+
+
+class UserDeletion(models.Model):
+    """Пользователь, чьи данные удаляет manage.py process_deletions."""
+    user_id = models.IntegerField(unique=True)
+    requested = models.DateTimeField(auto_now_add=True)
+
+
+class UserExport(models.Model):
+    """Начало последней выгрузки данных пользователя, см.
+    dump.claim_export."""
+    user_id = models.IntegerField(unique=True)
+    started = models.DateTimeField()
@@ -0,0 +1,50 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import is_sharded, shard_for, shards
+
+
+class PostShardRouter:
+    """Посты и комментарии лежат на шарде автора поста,
+    остальные модели - в default."""
+
+    def _shard_of(self, instance):
+        if instance is None:
+            return None
+        if is_sharded(instance) and instance._state.db in shards():
+            return instance._state.db
+        model_name = instance._meta.model_name
+        if model_name in ('post', 'archivedpost') \
+                and instance.author_id is not None:
+            return shard_for(instance.author_id)
+        if model_name in ('comment', 'archivedcomment'):
+            post = instance._meta.get_field('post')
+            if post.is_cached(instance):
+                return self._shard_of(instance.post)
+        if model_name == 'user' and instance.pk is not None:
+            return shard_for(instance.pk)
+        return None
+
+    def _route(self, model, instance=None, **hints):
+        if is_sharded(model):
+            return self._shard_of(instance)
+        # автор и группа поста с шарда читаются из default
+        if instance is not None and is_sharded(instance):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = set(shards()) | {DEFAULT_DB_ALIAS}
+        if {obj1._state.db, obj2._state.db} <= aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'posts' and model_name == 'postsequence':
+            return db == DEFAULT_DB_ALIAS
+        return None
@@ -0,0 +1,97 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Max
+
+# Модели, строки которых живут на шарде автора поста
+SHARDED_MODELS = {'post', 'comment', 'archivedpost', 'archivedcomment'}
+
+
+def shards():
+    return list(getattr(settings, 'POST_SHARDS', None) or [DEFAULT_DB_ALIAS])
+
+
+def shard_for(author_id):
+    aliases = shards()
+    return aliases[author_id % len(aliases)]
+
+
+def next_post_id():
+    """id нового поста. Автоинкремент у каждого шарда свой, поэтому
+    id выдаёт общая последовательность в default."""
+    from .models import PostSequence
+    return PostSequence.objects.using(DEFAULT_DB_ALIAS).create().pk
+
+
+def reserve_post_ids(top):
+    """Сдвигает последовательность, чтобы новые id были больше top."""
+    from .models import PostSequence
+    sequence = PostSequence.objects.using(DEFAULT_DB_ALIAS)
+    if top is None or top <= (sequence.aggregate(
+            top=Max('pk'))['top'] or 0):
+        return
+    sequence.create(pk=top)
+    connection = connections[DEFAULT_DB_ALIAS]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(
+                no_style(), [PostSequence]):
+            cursor.execute(sql)
+
+
+def is_sharded(model):
+    return (model._meta.app_label == 'posts'
+            and model._meta.model_name in SHARDED_MODELS)
+
+
+def author_posts(author):
+    from .models import Post
+    return Post.objects.using(shard_for(author.pk)).filter(author=author)
+
+
+def feed_key(post):
+    return post.pub_date, post.pk
+
+
+class ShardedFeed:
+    """Scatter-gather по шардам с k-way слиянием по pub_date.
+
+    Реализует ровно то, что нужно Paginator: count() и срезы.
+    """
+
+    def __init__(self, querysets):
+        # слиянию нужен тот же порядок внутри шарда, что и у feed_key
+        self.querysets = [qs.order_by('-pub_date', '-pk')
+                          for qs in querysets]
+
+    def count(self):
+        return sum(qs.count() for qs in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return heapq.merge(
+            *(qs.iterator() for qs in self.querysets),
+            key=feed_key, reverse=True)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        if stop is None:
+            return list(islice(self, start, None))
+        # каждый шард отдаёт не больше stop строк, дальше сливаем
+        parts = [list(qs[:stop]) for qs in self.querysets]
+        merged = heapq.merge(*parts, key=feed_key, reverse=True)
+        return list(islice(merged, start, stop))
+
+
+def sharded(queryset):
+    aliases = shards()
+    queryset = queryset.order_by('-pub_date', '-pk')
+    if len(aliases) == 1:
+        return queryset.using(aliases[0])
+    return ShardedFeed(queryset.using(alias) for alias in aliases)
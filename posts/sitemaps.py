@@ -0,0 +1,222 @@
+"""Карта сайта для поисковиков.
+
+Посты и профили разбиты на куски по диапазонам id: кусок - запрос
+pk >= lo AND pk < hi по первичному ключу, без OFFSET. XML куска
+кэшируется под ключом с его состоянием (число строк и время последней
+правки), так что перестраивается только кусок, в чьём диапазоне
+что-то поменялось. manage.py generate_sitemaps строит все куски
+заранее.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.contrib.flatpages.sitemaps import FlatPageSitemap
+from django.contrib.sitemaps import Sitemap
+from django.contrib.sites.models import Site
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.cache import cache_page
+
+from .models import ArchivedPost, Group, Post, User
+from .sharding import shards
+
+KEY = 'sitemap:{}:{}:{}'
+
+
+def protocol():
+    return getattr(settings, 'SITEMAP_PROTOCOL', 'https')
+
+
+def digest(names):
+    """Отпечаток имён из URL: переименование меняет состояние куска."""
+    return hashlib.md5('\n'.join(names).encode()).hexdigest()
+
+
+class Section(Sitemap):
+    """Раздел карты из одного куска."""
+    limit = 50000
+
+    def __init__(self, number=0):
+        self.number = number
+        self.protocol = protocol()
+
+    def chunks(self):
+        return 1
+
+    def state(self):
+        return ()
+
+
+class GroupSitemap(Section):
+    def items(self):
+        return list(Group.objects.order_by('pk').values_list(
+            'slug', flat=True))
+
+    def location(self, slug):
+        return reverse('group_posts', args=[slug])
+
+    def state(self):
+        return (digest(self.items()),)
+
+
+class FlatPagesSitemap(Section, FlatPageSitemap):
+    def items(self):
+        return super().items().order_by('pk')
+
+    def state(self):
+        return (digest(self.items().values_list('url', flat=True)),)
+
+
+class RangeSection(Section):
+    """Раздел, нарезанный на куски по SITEMAP_CHUNK_SIZE id."""
+    queryset = None
+    lastmod_field = None
+
+    def __init__(self, number=0):
+        super().__init__(number)
+        self.limit = getattr(settings, 'SITEMAP_CHUNK_SIZE', 10000)
+
+    def querysets(self):
+        """Пары (queryset, поле времени правки или None)."""
+        return [(self.queryset.all(), self.lastmod_field)]
+
+    def in_range(self, queryset):
+        low = self.number * self.limit
+        return queryset.filter(pk__gte=low, pk__lt=low + self.limit)
+
+    def chunks(self):
+        tops = [queryset.aggregate(top=Max('pk'))['top']
+                for queryset, _ in self.querysets()]
+        tops = [top for top in tops if top is not None]
+        return max(tops) // self.limit + 1 if tops else 0
+
+    def state(self):
+        state = ()
+        for queryset, field in self.querysets():
+            aggregates = {'count': Count('pk')}
+            if field:
+                aggregates['lastmod'] = Max(field)
+            state += tuple(
+                self.in_range(queryset).aggregate(**aggregates).values())
+        return state
+
+
+class PostSitemap(RangeSection):
+    """Горячие и архивные посты шарда alias: id у архивных те же."""
+
+    def __init__(self, alias, number=0):
+        super().__init__(number)
+        self.alias = alias
+
+    def querysets(self):
+        return [(Post.objects.using(self.alias), 'updated'),
+                (ArchivedPost.objects.using(self.alias), 'archived')]
+
+    def items(self):
+        rows = []
+        for queryset, field in self.querysets():
+            rows += self.in_range(queryset).order_by().values_list(
+                'pk', 'author_id', field)
+        # авторы живут в основной базе, грузим их одним запросом
+        usernames = dict(User.objects.filter(
+            pk__in={author_id for _, author_id, _ in rows}).values_list(
+            'pk', 'username'))
+        return sorted((usernames[author_id], pk, lastmod)
+                      for pk, author_id, lastmod in rows
+                      if author_id in usernames)
+
+    def location(self, item):
+        return reverse('post_view', args=item[:2])
+
+    def state(self):
+        # в URL постов входит имя автора
+        authors = set()
+        for queryset, _ in self.querysets():
+            authors.update(self.in_range(queryset).order_by().values_list(
+                'author_id', flat=True).distinct())
+        return super().state() + (digest(User.objects.filter(
+            pk__in=authors).order_by('pk').values_list(
+            'username', flat=True)),)
+
+    def lastmod(self, item):
+        return item[2]
+
+
+class ProfileSitemap(RangeSection):
+    queryset = User.objects.filter(is_active=True)
+
+    def items(self):
+        return list(self.in_range(self.queryset).order_by('pk').values_list(
+            'username', flat=True))
+
+    def location(self, username):
+        return reverse('profile', args=[username])
+
+    def state(self):
+        return super().state() + (digest(self.items()),)
+
+
+def sections():
+    result = {f'posts-{alias}': functools.partial(PostSitemap, alias)
+              for alias in shards()}
+    result.update(profiles=ProfileSitemap, groups=GroupSitemap,
+                  flatpages=FlatPagesSitemap)
+    return result
+
+
+def render_chunk(section, number, state=None):
+    """XML куска: из кэша или построенный и закэшированный."""
+    sitemap = sections()[section](number)
+    if state is None:
+        state = sitemap.state()
+    key = KEY.format(section, number, hashlib.md5(
+        repr(state).encode()).hexdigest())
+    content = cache.get(key)
+    if content is None:
+        urlset = sitemap.get_urls(site=Site.objects.get_current())
+        content = render_to_string('sitemap.xml', {'urlset': urlset})
+        cache.set(key, content, getattr(
+            settings, 'SITEMAP_CACHE_TIMEOUT', 24 * 60 * 60))
+    return content
+
+
+@cache_page(10 * 60, key_prefix='sitemap_index')
+def sitemap_index(request):
+    domain = Site.objects.get_current().domain
+    locations = [
+        f'{protocol()}://{domain}' + reverse('sitemap_chunk',
+                                             args=[name, number])
+        for name, section in sections().items()
+        for number in range(section().chunks())
+    ]
+    return HttpResponse(
+        render_to_string('sitemap_index.xml', {'sitemaps': locations}),
+        content_type='application/xml')
+
+
+def sitemap_chunk(request, section, number):
+    if section not in sections():
+        raise Http404
+    sitemap = sections()[section](number)
+    if number >= max(sitemap.chunks(), 1):
+        raise Http404
+    state = sitemap.state()
+    etag = quote_etag(hashlib.md5(
+        repr((section, number, state)).encode()).hexdigest())
+    dates = [part for part in state if hasattr(part, 'timestamp')]
+    timestamp = int(max(dates).timestamp()) if dates else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = HttpResponse(render_chunk(section, number, state),
+                                content_type='application/xml')
+    response['ETag'] = etag
+    if timestamp:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
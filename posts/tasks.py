@@ -0,0 +1,31 @@
+from jobs.queue import periodic
+from sorl.thumbnail import get_thumbnail
+
+from .archive import archive_posts
+from .deletion import delete_user_data, process_deletions
+from .models import Post
+from .sharding import shard_for
+
+# миниатюра карточки поста (cards.thumbnails)
+CARD_THUMBNAIL = ('960x339', {'crop': 'center', 'upscale': True})
+
+
+def make_thumbnail(post_id, author_id):
+    post = Post.objects.using(shard_for(author_id)).filter(pk=post_id).first()
+    if post is not None and post.image:
+        geometry, options = CARD_THUMBNAIL
+        get_thumbnail(post.image, geometry, **options)
+
+
+def delete_user(user_id):
+    delete_user_data(user_id)
+
+
+@periodic(every=24 * 60 * 60)
+def archive_old_posts():
+    archive_posts()
+
+
+@periodic(every=10 * 60)
+def sweep_deletions():
+    process_deletions()
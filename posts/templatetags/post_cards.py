@@ -0,0 +1,31 @@
+from django import template
+
+from posts.cards import PageCards, card_data
+from posts.cursors import encode_cursor
+from posts.sharding import feed_key
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """{% post_cards page as cards %}, затем в цикле по постам
+    {% include cards.template with post=post %}."""
+    return PageCards(posts)
+
+
+@register.simple_tag
+def card_image(post):
+    """Миниатюра картинки поста для карточки или None."""
+    return card_data(post)[1]
+
+
+@register.simple_tag
+def comment_count(post):
+    return card_data(post)[0]
+
+
+@register.filter
+def post_cursor(post):
+    """Курсор поста для опроса новых постов и подгрузки ленты."""
+    return encode_cursor(*feed_key(post))
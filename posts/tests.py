@@ -1,16 +1,61 @@
+import datetime as dt
+import gzip
 import io
+import json
+import os
+import shutil
 import tempfile
+import tracemalloc
+import zipfile
 from unittest import mock
 
 from PIL import Image
+from django.conf import settings
+from django.contrib.flatpages.models import FlatPage
+from django.contrib.sessions.models import Session
+from django.contrib.sites.models import Site
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.files import File
+from django.core.management import CommandError, call_command
+from django.template.loader import render_to_string
 from django.core.files.base import ContentFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
 from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Post, Group, User
+from django.utils import timezone
+from jobs.models import Job
+from yatube import memory, metrics, querylog
+from yatube.instrumentation import cache_label
+from yatube.profiling import profile_token
+from yatube.sessions import SessionStore, persist
+from yatube.warmup import compile_templates, warm_up
+from posts.archive import archive_posts, author_archive
+from posts.cursors import decode_cursor, encode_cursor
+from posts.deletion import process_deletions, schedule_user_deletion
+from posts.follows import KEY as FOLLOW_KEY, followed_ids, unpack
+from posts.models import (ArchivedComment, ArchivedPost, Comment, Follow,
+                          Post, Group, User, UserDeletion, UserExport)
+from posts.sharding import (ShardedFeed, next_post_id, reserve_post_ids,
+                            shard_for)
+from users.auth import KEY as USER_KEY
 from django.core.cache import cache
 
 
+def use_shared_cache(test):
+    """Файловый кэш вместо LocMem: его, как memcached, видят все
+    процессы, поэтому долгое кэширование включено."""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    shared = override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': directory,
+    }})
+    shared.enable()
+    test.addCleanup(shared.disable)
+
+
 class PostTests(TestCase):
     def setUp(self):
         cache.clear()
@@ -210,3 +255,1336 @@ class ServerErrorsTest(TestCase):
     def test_404(self):
         response = self.client.get('/nohaveadminpage/posts')
         self.assertEqual(response.status_code, 404)
+
+
+class ShardingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='shard1')
+        self.user2 = User.objects.create_user(username='shard2')
+        for i in range(7):
+            Post.objects.create(text=f'post {i}',
+                                author=(self.user, self.user2)[i % 2])
+
+    @override_settings(POST_SHARDS=['a', 'b', 'c'])
+    def test_shard_for(self):
+        self.assertEqual(shard_for(3), 'a')
+        self.assertEqual(shard_for(4), 'b')
+
+    def test_merged_feed(self):
+        # шарды имитируются непересекающимися выборками одной базы
+        feed = ShardedFeed(
+            Post.objects.filter(author=author).order_by('-pub_date', '-pk')
+            for author in (self.user, self.user2))
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        self.assertEqual(feed.count(), 7)
+        self.assertEqual(feed[0:3], expected[0:3])
+        self.assertEqual(feed[3:10], expected[3:])
+        self.assertEqual(list(feed), expected)
+
+    def test_post_ids_from_sequence(self):
+        top = Post.objects.order_by('-pk').first().pk
+        reserve_post_ids(top + 100)
+        post = Post.objects.create(text='new', author=self.user)
+        self.assertEqual(post.pk, top + 101)
+        reserve_post_ids(top)
+        self.assertEqual(
+            Post.objects.create(text='next', author=self.user).pk, top + 102)
+
+    def test_create_routed_by_author(self):
+        with mock.patch('posts.routers.shard_for',
+                        return_value='default') as route:
+            Post.objects.create(text='routed', author=self.user2)
+        route.assert_called_with(self.user2.pk)
+
+
+def add_database(test, alias):
+    """Ещё одна sqlite-база с миграциями, удаляется после теста."""
+    directory = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, directory)
+    connections.databases[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(directory, 'db.sqlite3'),
+    }
+    connections.ensure_defaults(alias)
+    connections.prepare_test_settings(alias)
+
+    def drop():
+        connections[alias].close()
+        del connections.databases[alias]
+        delattr(connections._connections, alias)
+    test.addCleanup(drop)
+    call_command('migrate', database=alias, verbosity=0)
+
+
+class ReshardTest(TestCase):
+    def setUp(self):
+        add_database(self, 'moved')
+        users = [User.objects.create_user(username=f'user{i}')
+                 for i in range(2)]
+        # при POST_SHARDS = ['default', 'moved'] нечётные id уходят в moved
+        self.author, self.other = sorted(
+            users, key=lambda user: user.pk % 2 == 0)
+        self.old = timezone.now() - dt.timedelta(days=400)
+        self.post = Post.objects.create(text='первый', author=self.author)
+        Comment.objects.create(post=self.post, author=self.other,
+                               text='комментарий')
+        self.second = Post.objects.create(text='второй',
+                                          author=self.author)
+        Post.objects.update(pub_date=self.old, updated=self.old)
+        Comment.objects.update(created=self.old)
+        self.archived = ArchivedPost.objects.create(
+            pk=next_post_id(), text='архив', pub_date=self.old,
+            author=self.author)
+        ArchivedComment.objects.create(
+            post=self.archived, author=self.other, text='старый',
+            created=self.old)
+        # пост, созданный на moved до общей последовательности
+        Post.all_objects.using('moved').create(
+            pk=self.second.pk, text='чужой', author=self.other)
+
+    def test_reshard(self):
+        out = io.StringIO()
+        with override_settings(POST_SHARDS=['default', 'moved']):
+            call_command('reshard', stdout=out)
+            archive = list(author_archive(self.author))
+        self.assertIn('default: перенесено 3, с новым id 1', out.getvalue())
+        self.assertIn('moved: перенесено 1, с новым id 0', out.getvalue())
+        moved = Post.all_objects.using('moved')
+        post = moved.get(pk=self.post.pk)
+        self.assertEqual((post.pub_date, post.updated), (self.old, self.old))
+        comment = Comment.all_objects.using('moved').get(post=post)
+        self.assertEqual(comment.created, self.old)
+        second = moved.get(text='второй')
+        self.assertNotEqual(second.pk, self.second.pk)
+        self.assertEqual(second.pub_date, self.old)
+        self.assertEqual(
+            Post.all_objects.get(pk=self.second.pk).text, 'чужой')
+        self.assertEqual(archive, [self.archived])
+        self.assertEqual(archive[0].archived, self.archived.archived)
+        self.assertEqual(
+            ArchivedComment.all_objects.using('moved').get().created,
+            self.old)
+        self.assertFalse(Post.all_objects.filter(author=self.author).exists())
+        self.assertFalse(ArchivedPost.all_objects.exists())
+        self.assertFalse(ArchivedComment.all_objects.exists())
+
+
+class ArchiveTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username='archiver')
+        self.old = Post.objects.create(text='old post', author=self.user)
+        Comment.objects.create(post=self.old, author=self.user,
+                               text='old comment')
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        Post.objects.create(text='fresh post', author=self.user)
+
+    def test_archive_posts(self):
+        self.assertEqual(archive_posts(), 1)
+        self.assertFalse(Post.objects.filter(pk=self.old.pk).exists())
+        archived = ArchivedPost.objects.get(pk=self.old.pk)
+        self.assertEqual(archived.comments.count(), 1)
+        self.assertEqual(archive_posts(), 0)
+
+    def test_taken_archive_id(self):
+        ArchivedPost.objects.create(pk=self.old.pk, text='other',
+                                    pub_date=timezone.now(), author=self.user)
+        with self.assertLogs('posts.archive', 'WARNING'):
+            self.assertEqual(archive_posts(), 0)
+        self.assertTrue(Post.objects.filter(pk=self.old.pk).exists())
+        self.assertEqual(Comment.objects.filter(post=self.old).count(), 1)
+
+    def test_archive_fallback(self):
+        archive_posts()
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'old post')
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'archiver'}))
+        self.assertContains(response, 'old post')
+        self.assertContains(response, 'fresh post')
+        response = self.client.get(reverse(
+            'post_view',
+            kwargs={'username': 'archiver', 'post_id': self.old.pk}))
+        self.assertContains(response, 'old comment')
+
+
+class DumpTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dumper')
+        self.user2 = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='g', slug='dump_group',
+                                          description='d')
+        self.post = Post.objects.create(text='line 1\nline 2',
+                                        author=self.user, group=self.group)
+        Post.objects.filter(pk=self.post.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=3))
+        Comment.objects.create(post=self.post, author=self.user2, text='c')
+        Follow.objects.create(user=self.user2, author=self.user)
+        self.old = Post.objects.create(text='old', author=self.user)
+        Comment.objects.create(post=self.old, author=self.user2,
+                               text='old comment')
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        archive_posts()
+
+    def roundtrip(self, fmt):
+        kinds = ('group', 'post', 'comment', 'follow', 'archivedpost',
+                 'archivedcomment')
+        with tempfile.TemporaryDirectory() as directory:
+            for kind in kinds:
+                call_command('export_data', kind, format=fmt,
+                             output=f'{directory}/{kind}', stderr=io.StringIO())
+            pub_date = Post.objects.get().pub_date
+            archived = ArchivedPost.objects.get().archived
+            Post.objects.all().delete()
+            ArchivedPost.objects.all().delete()
+            Group.objects.all().delete()
+            Follow.objects.all().delete()
+            for kind in kinds:
+                call_command('import_data', kind, format=fmt,
+                             input=f'{directory}/{kind}', batch_size=1,
+                             stdout=io.StringIO())
+        post = Post.objects.get(pk=self.post.pk)
+        self.assertEqual(post.text, 'line 1\nline 2')
+        self.assertEqual(post.group.slug, 'dump_group')
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comments.get().author, self.user2)
+        self.assertTrue(self.user2.follower.filter(author=self.user).exists())
+        old = ArchivedPost.objects.get(pk=self.old.pk)
+        self.assertEqual(old.archived, archived)
+        self.assertEqual(old.comments.get().text, 'old comment')
+
+    def test_jsonl_roundtrip(self):
+        self.roundtrip('jsonl')
+
+    def test_csv_roundtrip(self):
+        self.roundtrip('csv')
+
+    def test_import_skips_existing(self):
+        out = io.StringIO()
+        with tempfile.NamedTemporaryFile('w+', suffix='.jsonl') as dump:
+            call_command('export_data', 'post', output=dump.name,
+                         stderr=io.StringIO())
+            call_command('import_data', 'post', input=dump.name, stdout=out)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertIn('загружено 0, пропущено 1', out.getvalue())
+
+
+class UserExportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='exporter')
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_ndjson(self):
+        post = Post.objects.create(text='exported', author=self.user)
+        Comment.objects.create(post=post, author=self.user, text='mine')
+        response = self.client.get(reverse('user_export'))
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['type'] for row in rows], ['post', 'comment'])
+        self.assertEqual(rows[0]['text'], 'exported')
+        self.assertEqual(
+            self.client.get(reverse('user_export')).status_code, 429)
+
+    def test_zip_with_image(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory):
+                Post.objects.create(
+                    text='with image', author=self.user,
+                    image=ContentFile(b'pixels', name='pic.png'))
+                response = self.client.get(
+                    reverse('user_export'), {'format': 'zip'})
+                data = b''.join(response.streaming_content)
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIn('posts.ndjson', archive.namelist())
+        self.assertEqual(archive.read('posts/pic.png'), b'pixels')
+
+    def test_anonymous(self):
+        response = Client().get(reverse('user_export'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_limit_in_database(self):
+        b''.join(self.client.get(reverse('user_export')).streaming_content)
+        cache.clear()
+        self.assertEqual(
+            self.client.get(reverse('user_export')).status_code, 429)
+        UserExport.objects.update(
+            started=timezone.now() - dt.timedelta(hours=2))
+        self.assertEqual(
+            self.client.get(reverse('user_export')).status_code, 200)
+
+    def test_broken_export_not_counted(self):
+        for text in ('first', 'second'):
+            Post.objects.create(text=text, author=self.user)
+        response = self.client.get(reverse('user_export'))
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertFalse(UserExport.objects.exists())
+        self.assertEqual(
+            self.client.get(reverse('user_export')).status_code, 200)
+
+
+class DeletionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='leaving')
+        self.user2 = User.objects.create_user(username='staying')
+        self.post = Post.objects.create(text='leaving post', author=self.user)
+        other = Post.objects.create(text='staying post', author=self.user2)
+        for i in range(5):
+            Comment.objects.create(post=self.post, author=self.user2,
+                                   text=f'reply {i}')
+        Comment.objects.create(post=other, author=self.user, text='bye')
+        Follow.objects.create(user=self.user2, author=self.user)
+
+    def test_hidden_right_away(self):
+        schedule_user_deletion(self.user)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        response = Client().get(reverse('index'))
+        self.assertNotContains(response, 'leaving post')
+        self.assertContains(response, 'staying post')
+        self.assertEqual(Comment.objects.filter(author=self.user).count(), 0)
+        self.assertEqual(Post.all_objects.count(), 2)
+
+    def test_process_deletions(self):
+        schedule_user_deletion(self.user)
+        self.assertEqual(process_deletions(batch_size=2), 1)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(Post.all_objects.count(), 1)
+        self.assertEqual(Comment.all_objects.count(), 0)
+        self.assertFalse(Follow.objects.exists())
+        self.assertFalse(UserDeletion.objects.exists())
+
+    def test_admin_delete_is_deferred(self):
+        admin = User.objects.create_superuser('admin', 'a@a.ru', 'pass')
+        client = Client()
+        client.force_login(admin)
+        url = reverse('admin:auth_user_delete', args=[self.user.pk])
+        self.assertEqual(client.get(url).status_code, 200)
+        client.post(url, {'post': 'yes'})
+        self.assertTrue(User.objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(
+            UserDeletion.objects.filter(user_id=self.user.pk).exists())
+
+
+class ServerTimingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='timed')
+        Post.objects.create(text='timed post', author=self.user)
+
+    def test_header_and_log(self):
+        with self.assertLogs('yatube.requests', 'INFO') as logs:
+            response = self.client.get(
+                reverse('profile', kwargs={'username': 'timed'}))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertIn('url=profile', logs.output[0])
+
+    def test_cache_hits(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index'))
+        self.assertRegex(response['Server-Timing'],
+                         r'cache;desc="[1-9]\d* hits 0 misses"')
+
+
+@override_settings(METRICS_TOKEN='scrape-token')
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_endpoint(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, 'yatube_http_request_duration_seconds_bucket'
+                      '{view="index",le="+Inf"}')
+        self.assertContains(response, 'yatube_db_queries_per_request_count')
+        self.assertContains(response, 'yatube_cache_hit_ratio'
+                                      '{cache="index_page"}')
+
+    def test_cache_labels_bounded(self):
+        self.assertEqual(cache_label('followed:7'), 'followed')
+        self.assertEqual(cache_label('sorl-thumbnail||image||0a1b'),
+                         'sorl-thumbnail')
+        self.assertEqual(cache_label('yatube.sessionsr9tas2x'), 'other')
+        self.assertEqual(cache_label('9f86d081884c7d65'), 'other')
+
+    def test_worker_flushes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                    METRICS_DIR=directory,
+                    EMAIL_DELIVERY_BACKEND=(
+                        'django.core.mail.backends.locmem.EmailBackend')):
+                call_command('run_worker', '--burst', stdout=io.StringIO())
+                self.assertIn(f'{os.getpid()}.json', os.listdir(directory))
+
+    def test_forbidden_without_token(self):
+        # за прокси все запросы приходят с 127.0.0.1
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(
+            User.objects.create_user(username='admin', is_staff=True))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_merge_processes(self):
+        registry = metrics.Registry()
+        registry.inc('http_requests_total', view='index', status=200)
+        registry.observe('http_request_duration_seconds', 0.02, view='index')
+        snapshot = registry.snapshot()
+        with tempfile.TemporaryDirectory() as directory:
+            for pid in (1, 2):
+                with open(f'{directory}/{pid}.json', 'w') as stream:
+                    json.dump(snapshot, stream)
+            with override_settings(METRICS_DIR=directory):
+                # два чужих снимка и снимок текущего процесса
+                self.assertEqual(len(metrics.collect()), 3)
+        text = metrics.exposition([snapshot, snapshot])
+        self.assertIn('yatube_http_requests_total'
+                      '{status="200",view="index"} 2', text)
+        self.assertIn('yatube_http_request_duration_seconds_bucket'
+                      '{view="index",le="0.025"} 2', text)
+
+
+class QueryLogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        querylog.querylog.stats.clear()
+        self.user = User.objects.create_user(username='sql')
+        Post.objects.create(text='Пост', author=self.user)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            querylog.fingerprint(
+                "SELECT * FROM t WHERE id IN (1, 2,3) AND name = 'a''b'"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ?')
+        self.assertEqual(querylog.fingerprint('SELECT  %s\n LIMIT 21'),
+                         'SELECT %s LIMIT ?')
+
+    def test_stats_per_view(self):
+        self.client.get(reverse('profile', args=['sql']))
+        self.client.get(reverse('profile', args=['sql']))
+        rows = querylog.top(querylog.collect(), by='count', view='profile')
+        self.assertTrue(rows)
+        self.assertGreaterEqual(rows[0]['count'], 2)
+        self.assertEqual(rows[0]['views'][0][0], 'profile')
+
+    @override_settings(QUERYLOG_SLOW_MS=0)
+    def test_slow_query_logged_with_plan(self):
+        with self.assertLogs('yatube.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('profile', args=['sql']))
+        self.assertIn('view=profile', logs.output[0])
+        self.assertIn('plan=', logs.output[0])
+        self.assertTrue(any('SCAN' in line or 'SEARCH' in line
+                            for line in logs.output))
+
+    def test_top_queries_command(self):
+        self.client.get(reverse('profile', args=['sql']))
+        out = io.StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(METRICS_DIR=directory):
+                querylog.querylog.flush(force=True)
+                call_command('top_queries', '--by', 'p99', '--limit', '3',
+                             stdout=out)
+        self.assertIn('posts_post', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('top_queries')
+
+    @override_settings(QUERYLOG_SLOW_MS=0)
+    def test_explain_not_counted(self):
+        with self.assertLogs('yatube.slow_queries', 'WARNING'):
+            response = self.client.get(reverse('profile', args=['sql']))
+        logged = sum(entry[2] for entry in querylog.querylog.snapshot())
+        self.assertIn(f'desc="{logged} queries"', response['Server-Timing'])
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profile_files(self, view):
+        path = f'{self.directory}/{view}'
+        return os.listdir(path) if os.path.isdir(path) else []
+
+    def test_signed_header(self):
+        with override_settings(PROFILE_DIR=self.directory,
+                               PROFILE_INTERVAL=0.0005):
+            Client().get(reverse('index'), HTTP_X_PROFILE_TOKEN='bad')
+            self.assertEqual(self.profile_files('index'), [])
+            Client().get(reverse('index'),
+                         HTTP_X_PROFILE_TOKEN=profile_token())
+        files = self.profile_files('index')
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.folded'))
+
+    def test_sample_rate_cprofile(self):
+        with override_settings(PROFILE_DIR=self.directory,
+                               PROFILE_SAMPLE_RATE=1,
+                               PROFILE_MODE='cprofile'):
+            Client().get(reverse('index'))
+        self.assertTrue(self.profile_files('index')[0].endswith('.prof'))
+        out = io.StringIO()
+        with override_settings(PROFILE_DIR=self.directory):
+            call_command('profile_report', stdout=out, stderr=io.StringIO())
+        self.assertIn('cumulative', out.getvalue())
+
+    def test_report_merges_folded_stacks(self):
+        for view, name in (('index', 'a'), ('index', 'b'), ('group', 'a')):
+            os.makedirs(f'{self.directory}/{view}', exist_ok=True)
+            with open(f'{self.directory}/{view}/{name}.folded', 'w') as f:
+                f.write('main (x.py:1);render (y.py:2) 3\n')
+        output = f'{self.directory}/out.folded'
+        with override_settings(PROFILE_DIR=self.directory):
+            call_command('profile_report', '--output', output,
+                         stderr=io.StringIO())
+        with open(output) as stream:
+            lines = stream.read().splitlines()
+        self.assertEqual(lines, [
+            'index;main (x.py:1);render (y.py:2) 6',
+            'group;main (x.py:1);render (y.py:2) 3',
+        ])
+
+
+@override_settings(MEMORY_TRACE_FRAMES=1, MEMORY_SNAPSHOT_INTERVAL=3600)
+class MemoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(username='staff',
+                                              is_staff=True)
+        self.client.force_login(self.staff)
+
+    def tearDown(self):
+        tracemalloc.stop()
+        memory.tracker.baseline = memory.tracker.latest = None
+
+    def test_report_for_staff(self):
+        self.client.get(reverse('index'))
+        self.assertTrue(tracemalloc.is_tracing())
+        response = self.client.get(reverse('memory'), {'limit': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Рост с первого снимка')
+        self.assertContains(response, 'peak=')
+
+    def test_forbidden_for_users(self):
+        self.staff.is_staff = False
+        self.staff.save()
+        response = self.client.get(reverse('memory'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_request_peak_metric(self):
+        self.client.get(reverse('index'))
+        text = metrics.exposition([metrics.registry.snapshot()])
+        self.assertIn('yatube_request_peak_memory_bytes_count'
+                      '{view="index"}', text)
+
+    def test_diff_by_allocation_site(self):
+        memory.enable()
+        memory.tracker.take()
+        leak = [bytearray(1024) for _ in range(1000)]
+        memory.tracker.take()
+        top = memory.tracker.diff(limit=1)[0]
+        self.assertGreaterEqual(top.size_diff, 1024 * 1000)
+        self.assertIn('tests.py', str(top))
+        del leak
+
+
+class WarmupTest(TestCase):
+    def test_warm_up(self):
+        report = warm_up(WSGIHandler())
+        steps = {name: detail for name, _, detail in report.steps}
+        self.assertEqual(list(steps), ['urls', 'i18n', 'templates', 'site',
+                                       'requests', 'flatpages'])
+        self.assertEqual(steps['requests'], '/ 200')
+        self.assertEqual(steps['site'], 'example.com')
+        self.assertNotIn('ошибка', report.render())
+
+    def test_compile_templates(self):
+        count, errors = compile_templates()
+        self.assertGreater(count, 10)
+        self.assertEqual(errors, [])
+
+
+class CompileTemplatesTest(TestCase):
+    def test_validate_and_benchmark(self):
+        user = User.objects.create_user(username='bench')
+        group = Group.objects.create(title='G', slug='g', description='d')
+        Post.objects.create(text='Пост', author=user, group=group)
+        out = io.StringIO()
+        call_command('compile_templates', '--benchmark', '--repeat', '1',
+                     stdout=out)
+        self.assertIn('ошибок: 0', out.getvalue())
+        for name in ('index.html', 'profile.html', 'group.html'):
+            self.assertIn(name, out.getvalue())
+
+
+class PostCardTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='a.b+c@d')
+        self.other = User.objects.create_user(username='other')
+        group = Group.objects.create(title='<Группа>', slug='g-1',
+                                     description='d')
+        self.posts = [
+            Post.objects.create(text='<b>жирный</b> & \nвторая строка',
+                                author=self.author, group=group),
+            Post.objects.create(text='без группы', author=self.other),
+        ]
+        Comment.objects.create(post=self.posts[0], author=self.other,
+                               text='Комментарий')
+        Comment.objects.create(post=self.posts[0], author=self.other,
+                               text='Скрытый', hidden=True)
+
+    def render(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('index')).content.decode()
+
+    def test_links_and_counts(self):
+        html = self.render(self.author)
+        self.assertIn('href="/a.b+c@d/"', html)
+        self.assertIn('href="/group/g-1"', html)
+        self.assertIn('&lt;Группа&gt;', html)
+        self.assertIn('&lt;b&gt;жирный&lt;/b&gt; &amp; <br>вторая строка',
+                      html)
+        self.assertIn('1 комментариев', html)
+        self.assertIn('Добавить комментарий', html)
+        self.assertIn(f'/a.b+c@d/{self.posts[0].pk}/edit/', html)
+        self.assertNotIn(f'/other/{self.posts[1].pk}/edit/', html)
+
+    def test_image(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            with override_settings(MEDIA_ROOT=temp_directory):
+                image = io.BytesIO()
+                Image.new('RGB', (50, 50)).save(image, format='png')
+                self.posts[1].image = ContentFile(image.getvalue(),
+                                                  name='card.png')
+                self.posts[1].save()
+                self.assertIn('<img class="card-img"',
+                              self.render(self.other))
+
+    def test_numeric_username(self):
+        author = User.objects.create_user(username='987654321')
+        post = Post.objects.create(text='цифры', author=author)
+        html = self.render(author)
+        self.assertIn(f'href="/987654321/{post.pk}/"', html)
+        self.assertIn(f'href="/987654321/{post.pk}/edit/"', html)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='G', slug='g',
+                                          description='d')
+        self.post = Post.objects.create(text='Пост', author=self.author,
+                                        group=self.group)
+        self.client.force_login(self.reader)
+        self.urls = [
+            reverse('index'),
+            reverse('group_posts', args=['g']),
+            reverse('profile', args=['author']),
+            reverse('post_view', args=['author', self.post.pk]),
+        ]
+
+    def revalidate(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        cache.clear()
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_not_modified(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.revalidate(url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_comment_changes_validators(self):
+        etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+        self.client.post(reverse('add_comment', args=['author', self.post.pk]),
+                         {'text': 'Новый'})
+        cache.clear()
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+
+    def test_depends_on_viewer_and_follow(self):
+        url = reverse('profile', args=['author'])
+        etag = self.client.get(url)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        other = Client()
+        other.force_login(self.author)
+        self.assertEqual(
+            other.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cached_index_without_queries(self):
+        client = Client()
+        etag = client.get(reverse('index'))['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(reverse('index')).status_code, 200)
+            response = client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # 304 не подменяет страницу в кэше
+        cache.clear()
+        client.get(reverse('index'), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(client.get(reverse('index')), 'Пост')
+
+    def test_hidden_comment_changes_validators(self):
+        comment = Comment.objects.create(post=self.post, author=self.reader,
+                                         text='Скроют')
+        url = reverse('post_view', args=['author', self.post.pk])
+        response = self.client.get(url)
+        # время правки при скрытии не растёт, поэтому его нет в ответе
+        self.assertNotIn('Last-Modified', response)
+        Comment.all_objects.filter(pk=comment.pk).update(hidden=True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_not_modified_queries(self):
+        client = Client()
+        url = reverse('post_view', args=['author', self.post.pk])
+        etag = client.get(url)['ETag']
+        # автор с подписками и пост со счётчиками
+        with self.assertNumQueries(2):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(COMMENTS_PAGE_SIZE=5)
+class CommentPagesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.author)
+        self.url = reverse('post_view', args=['author', self.post.pk])
+
+    def comment(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f'reader{i}')
+            Comment.objects.create(post=self.post, author=user,
+                                   text=f'Комментарий {i}')
+
+    def page_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        return len(queries)
+
+    def test_first_chunk(self):
+        self.comment(7)
+        response = self.client.get(self.url)
+        items = response.context['items']
+        self.assertEqual(len(items), 5)
+        self.assertEqual(items[0].text, 'Комментарий 6')
+        self.assertIsNotNone(response.context['next_cursor'])
+        self.assertContains(response, reverse(
+            'post_comments', args=['author', self.post.pk]))
+
+    def test_bounded_queries(self):
+        self.comment(6)
+        few = self.page_queries()
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.author, text='Ещё')
+            for i in range(30))
+        self.assertEqual(self.page_queries(), few)
+
+    def test_fragments_cover_all_comments(self):
+        self.comment(12)
+        response = self.client.get(self.url)
+        seen = [item.pk for item in response.context['items']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.client.get(
+                reverse('post_comments', args=['author', self.post.pk]),
+                {'after': cursor})
+            self.assertTemplateUsed(response, 'includes/comment_items.html')
+            seen += [item.pk for item in response.context['items']]
+            cursor = response.context['next_cursor']
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        self.assertEqual(len(set(seen)), 12)
+        self.assertNotContains(response, 'data-comments-more')
+
+    def test_bad_cursor(self):
+        url = reverse('post_comments', args=['author', self.post.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(
+            self.client.get(url, {'after': 'x.y'}).status_code, 404)
+
+
+class FeedFragmentTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='G', slug='g',
+                                          description='d')
+        now = timezone.now()
+        for i in range(23):
+            post = Post.objects.create(text=f'Пост номер {i}',
+                                       author=self.author, group=self.group)
+            # одинаковые даты у пар постов проверяют разбор по id
+            Post.objects.filter(pk=post.pk).update(
+                pub_date=now - dt.timedelta(minutes=i // 2))
+        self.client.force_login(self.author)
+        Follow.objects.create(user=User.objects.create_user('reader'),
+                              author=self.author)
+
+    def scroll(self, url):
+        response = self.client.get(url)
+        texts = [post.text for post in response.context['page']]
+        cursor = response.context['next_cursor']
+        while cursor:
+            response = self.client.get(url, {'after': cursor})
+            self.assertTemplateUsed(response, 'includes/feed_cards.html')
+            self.assertTemplateNotUsed(response, 'base.html')
+            texts += [post.text for post in response.context['posts']]
+            cursor = response.context['next_cursor']
+        return texts
+
+    def test_scroll_covers_feed(self):
+        order = sorted(range(23), key=lambda i: (i // 2, -i))
+        expected = [f'Пост номер {i}' for i in order]
+        for url in (reverse('index'), reverse('group_posts', args=['g']),
+                    reverse('profile', args=['author'])):
+            with self.subTest(url=url):
+                self.assertEqual(self.scroll(url), expected)
+
+    def test_follow_feed(self):
+        self.client.force_login(User.objects.get(username='reader'))
+        self.assertEqual(len(self.scroll(reverse('follow_index'))), 23)
+
+    def test_profile_includes_archive(self):
+        old = Post.objects.create(text='Архивный', author=self.author)
+        Post.objects.filter(pk=old.pk).update(
+            pub_date=timezone.now() - dt.timedelta(days=400))
+        archive_posts()
+        texts = self.scroll(reverse('profile', args=['author']))
+        self.assertEqual(texts[-1], 'Архивный')
+
+    def test_fragment_is_small(self):
+        url = reverse('index')
+        page = self.client.get(url)
+        self.assertContains(page, 'data-feed-more')
+        fragment = self.client.get(url, {'after': page.context[
+            'next_cursor']})
+        self.assertNotContains(fragment, '<html')
+        self.assertContains(fragment, 'card-text')
+        self.assertLess(len(fragment.content), len(page.content))
+
+    def test_bad_cursor(self):
+        self.assertIsNone(decode_cursor('1.2.3'))
+        response = self.client.get(reverse('index'), {'after': 'bad'})
+        self.assertEqual(response.status_code, 404)
+
+
+class NewPostsTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(title='G', slug='g',
+                                          description='d')
+        self.first = Post.objects.create(text='Первый', author=self.author)
+        self.url = reverse('new_posts')
+
+    def poll(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_newest_without_since(self):
+        cache.clear()
+        expected = encode_cursor(self.first.pub_date, self.first.pk)
+        self.assertEqual(self.poll()['newest'], expected)
+        self.assertEqual(self.poll(feed='group', slug='g')['newest'], None)
+
+    def test_nothing_new_answered_from_cache(self):
+        since = self.poll()['newest']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.poll(since)['count'], 0)
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_process_cache_reads_database(self):
+        since = self.poll()['newest']
+        # пост от другого процесса: сигнал здесь не срабатывает
+        Post.objects.bulk_create([Post(pk=next_post_id(), text='Чужой',
+                                       author=self.author)])
+        self.assertEqual(self.poll(since)['count'], 1)
+        self.assertIsNone(cache.get('feed_mark:index'))
+
+    def test_counts_per_feed(self):
+        since = self.poll()['newest']
+        other = User.objects.create_user(username='other')
+        Post.objects.create(text='В группе', author=other, group=self.group)
+        Post.objects.create(text='Автора', author=self.author)
+        self.assertEqual(self.poll(since)['count'], 2)
+        self.assertEqual(self.poll(since, feed='group', slug='g')['count'], 1)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.force_login(self.reader)
+        self.assertEqual(self.poll(since, feed='follow')['count'], 1)
+
+    def test_edit_into_group(self):
+        self.assertIsNone(self.poll(feed='group', slug='g')['newest'])
+        self.first.group = self.group
+        self.first.save()
+        self.assertEqual(self.poll(feed='group', slug='g')['newest'],
+                         self.poll()['newest'])
+
+    def test_group_on_other_shard(self):
+        add_database(self, 's1')
+        since = self.poll()['newest']
+        with override_settings(POST_SHARDS=['default', 's1']):
+            # при двух шардах нечётные id авторов уходят в s1
+            author = next(user for user in (
+                User.objects.create_user(username=f'user{i}')
+                for i in range(2)) if user.pk % 2)
+            post = Post.objects.create(text='В группе', author=author,
+                                       group=self.group)
+            self.assertEqual(post._state.db, 's1')
+            data = self.poll(since, feed='group', slug='g')
+        self.assertEqual(data['count'], 1)
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_follow_without_shared_cache(self):
+        self.client.force_login(self.reader)
+        since = self.poll()['newest']
+
+        def poll_queries(count):
+            for i in range(count):
+                author = User.objects.create_user(
+                    username=f'new{count}_{i}')
+                Follow.objects.create(user=self.reader, author=author)
+                Post.objects.create(text=f'Пост {i}', author=author)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(
+                    self.poll(since, feed='follow')['count'], count)
+            Follow.objects.all().delete()
+            return len(queries)
+
+        # число запросов не растёт с числом подписок
+        self.assertEqual(poll_queries(1), poll_queries(3))
+
+    @override_settings(NEW_POSTS_LIMIT=2)
+    def test_limit(self):
+        since = self.poll()['newest']
+        for i in range(4):
+            Post.objects.create(text=f'Новый {i}', author=self.author)
+        data = self.poll(since)
+        self.assertEqual((data['count'], data['more']), (2, True))
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.get(self.url, {'since': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(self.url, {'feed': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(self.url, {'feed': 'follow'}).status_code, 403)
+
+
+class SyndicationTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        self.author = User.objects.create_user(username='author')
+        self.group = Group.objects.create(title='Группа', slug='g',
+                                          description='d')
+        for i in range(3):
+            self.post = Post.objects.create(
+                text=f'Запись {i}', author=self.author, group=self.group)
+        self.urls = [
+            reverse('latest_rss'), reverse('latest_atom'),
+            reverse('group_rss', args=['g']),
+            reverse('group_atom', args=['g']),
+            reverse('author_rss', args=['author']),
+            reverse('author_atom', args=['author']),
+        ]
+
+    def test_feeds(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, 'Запись 2')
+                self.assertContains(response, reverse(
+                    'post_view', args=['author', self.post.pk]))
+        self.assertIn('atom', self.client.get(
+            reverse('latest_atom'))['Content-Type'])
+
+    @override_settings(SYNDICATION_ITEMS=2)
+    def test_bounded(self):
+        response = self.client.get(reverse('latest_rss'))
+        self.assertEqual(response.content.count(b'<item>'), 2)
+
+    def test_cached_until_new_post(self):
+        url = reverse('group_rss', args=['g'])
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='Свежая', author=self.author,
+                            group=self.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Свежая')
+
+    def test_unknown(self):
+        self.assertEqual(self.client.get(
+            reverse('group_rss', args=['nope'])).status_code, 404)
+        self.assertEqual(self.client.get(
+            reverse('author_atom', args=['nope'])).status_code, 404)
+
+
+@override_settings(SITEMAP_CHUNK_SIZE=3, SITEMAP_PROTOCOL='http')
+class SitemapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author')
+        Group.objects.create(title='G', slug='g', description='d')
+        self.posts = [Post.objects.create(text=f'Пост {i}', author=self.author)
+                      for i in range(5)]
+
+    def chunk_url(self, post):
+        return reverse('sitemap_chunk', args=['posts-default',
+                                              post.pk // 3])
+
+    def test_index(self):
+        response = self.client.get(reverse('sitemap'))
+        for post in self.posts:
+            self.assertContains(response, self.chunk_url(post))
+        self.assertContains(response, reverse('sitemap_chunk',
+                                              args=['groups', 0]))
+        self.assertContains(response, reverse('sitemap_chunk',
+                                              args=['profiles', 0]))
+
+    def test_chunks(self):
+        for post in self.posts:
+            response = self.client.get(self.chunk_url(post))
+            self.assertContains(response, reverse(
+                'post_view', args=['author', post.pk]))
+        response = self.client.get(reverse('sitemap_chunk',
+                                           args=['groups', 0]))
+        self.assertContains(response, reverse('group_posts', args=['g']))
+        self.assertContains(self.client.get(reverse(
+            'sitemap_chunk', args=['profiles', 0])), '/author/')
+        top = max(post.pk for post in self.posts) // 3 + 1
+        for section, number in (('posts-default', top), ('groups', 1),
+                                ('nope', 0)):
+            self.assertEqual(self.client.get(reverse(
+                'sitemap_chunk', args=[section, number])).status_code, 404)
+
+    def test_regenerated_when_range_changes(self):
+        first, last = self.chunk_url(self.posts[0]), self.chunk_url(
+            self.posts[-1])
+        self.assertNotEqual(first, last)
+        with mock.patch('posts.sitemaps.render_to_string',
+                        wraps=render_to_string) as render:
+            call_command('generate_sitemaps', stdout=io.StringIO())
+            built = render.call_count
+            etag = self.client.get(last)['ETag']
+            self.client.get(first)
+            self.assertEqual(render.call_count, built)
+            self.posts[-1].text = 'Правка'
+            self.posts[-1].save()
+            response = self.client.get(last, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(render.call_count, built + 1)
+            response = self.client.get(
+                last, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_renames_rebuild(self):
+        chunks = [self.chunk_url(self.posts[0]),
+                  reverse('sitemap_chunk', args=['profiles', 0]),
+                  reverse('sitemap_chunk', args=['groups', 0])]
+        for url in chunks:
+            self.client.get(url)
+        self.author.username = 'renamed'
+        self.author.save()
+        Group.objects.update(slug='renamed-group')
+        for url in chunks[:2]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), '/renamed/')
+        self.assertContains(self.client.get(chunks[2]),
+                            '/group/renamed-group<')
+
+
+class FlatPageCacheTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        self.page = FlatPage.objects.create(
+            url='/about-us/', title='О нас', content='Первая версия')
+        self.page.sites.add(Site.objects.get_current())
+
+    def test_cached_until_saved(self):
+        url = reverse('about')
+        self.assertContains(self.client.get(url), 'Первая версия')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Первая версия')
+        self.page.content = 'Вторая версия'
+        self.page.save()
+        self.assertContains(self.client.get(url), 'Вторая версия')
+        self.page.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_user_sees_own_menu(self):
+        url = reverse('about')
+        self.client.get(url)
+        self.client.force_login(User.objects.create_user(username='reader'))
+        self.assertContains(self.client.get(url), 'reader')
+
+    def test_sites_change(self):
+        self.client.get(reverse('about'))
+        self.page.sites.clear()
+        self.assertEqual(self.client.get(reverse('about')).status_code, 404)
+
+    def test_warm_up(self):
+        report = warm_up(WSGIHandler())
+        steps = {name: detail for name, _, detail in report.steps}
+        self.assertEqual(steps['flatpages'], '/about/about-us/ 200')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('about'))
+
+    @override_settings(CACHES=settings.CACHES, LOCAL_CACHE_TIMEOUT=5)
+    def test_process_cache_expires(self):
+        cache.clear()
+        with mock.patch.object(cache, 'set') as cache_set:
+            self.client.get(reverse('about'))
+        timeouts = {call[0][2] for call in cache_set.call_args_list
+                    if call[0][0].startswith('flatpage')}
+        self.assertEqual(timeouts, {5})
+
+
+class CachedAuthTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        self.user = User.objects.create_user(username='reader',
+                                             password='old-password')
+        page = FlatPage.objects.create(url='/about-us/', title='О нас',
+                                       content='Текст')
+        page.sites.add(Site.objects.get_current())
+        self.client.force_login(self.user)
+        self.url = reverse('about')
+
+    def test_steady_state_without_queries(self):
+        self.assertContains(self.client.get(self.url), 'reader')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), 'reader')
+
+    def test_password_change_logs_out(self):
+        self.client.get(self.url)
+        self.user.set_password('new-password')
+        self.user.save()
+        self.assertNotContains(self.client.get(self.url), 'reader')
+
+    def test_profile_change_visible(self):
+        self.client.get(self.url)
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertContains(self.client.get(self.url), 'renamed')
+
+    def test_scheduled_deletion_logs_out(self):
+        self.client.get(self.url)
+        schedule_user_deletion(self.user)
+        self.assertNotContains(self.client.get(self.url), 'reader')
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_process_cache_not_used(self):
+        self.client.get(self.url)
+        self.assertIsNone(cache.get(USER_KEY.format(self.user.pk)))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertNotContains(self.client.get(self.url), 'reader')
+
+
+class SessionStoreTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        store = SessionStore()
+        store['theme'] = 'dark'
+        store.save(must_create=True)
+        self.key = store.session_key
+
+    @override_settings(SESSION_WRITE_BEHIND_DELAY=None)
+    def test_unchanged_save_skipped(self):
+        store = SessionStore(self.key)
+        store['theme'] = 'dark'
+        with self.assertNumQueries(0):
+            store.save()
+        store['theme'] = 'light'
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        self.assertTrue(any('django_session' in query['sql']
+                            for query in queries))
+
+    def test_write_behind(self):
+        store = SessionStore(self.key)
+        store['theme'] = 'light'
+        store.save()
+        store['theme'] = 'blue'
+        store.save()
+        session = Session.objects.get(pk=self.key)
+        self.assertEqual(session.get_decoded()['theme'], 'dark')
+        self.assertEqual(SessionStore(self.key)['theme'], 'blue')
+        job = Job.objects.get(task='yatube.sessions.persist')
+        self.assertEqual(json.loads(job.args), [self.key])
+        persist(self.key)
+        session = Session.objects.get(pk=self.key)
+        self.assertEqual(session.get_decoded()['theme'], 'blue')
+
+    def test_cache_key_label(self):
+        self.assertEqual(cache_label(SessionStore(self.key).cache_key),
+                         'yatube.sessions')
+
+    @override_settings(CACHES=settings.CACHES)
+    def test_process_cache_uses_database(self):
+        store = SessionStore(self.key)
+        self.assertEqual(store['theme'], 'dark')
+        store['theme'] = 'light'
+        store.save()
+        self.assertIsNone(cache.get(store.cache_key))
+        session = Session.objects.get(pk=self.key)
+        self.assertEqual(session.get_decoded()['theme'], 'light')
+        store.delete()
+        self.assertFalse(SessionStore(self.key).exists(self.key))
+
+
+class FollowCacheTest(TestCase):
+    def setUp(self):
+        use_shared_cache(self)
+        self.reader = User.objects.create_user(username='reader')
+        self.author = User.objects.create_user(username='author')
+        Post.objects.create(text='Пост автора', author=self.author)
+        self.client.force_login(self.reader)
+
+    def cached_ids(self, user):
+        return set(unpack(cache.get(FOLLOW_KEY.format(user.pk))))
+
+    def test_follow_resets_cache(self):
+        self.assertEqual(followed_ids(self.reader), frozenset())
+        self.client.get(reverse('profile_follow', args=['author']))
+        self.assertIsNone(cache.get(FOLLOW_KEY.format(self.reader.pk)))
+        self.assertContains(self.client.get(reverse('follow_index')),
+                            'Пост автора')
+        self.assertEqual(self.cached_ids(self.reader), {self.author.pk})
+        self.client.get(reverse('profile_unfollow', args=['author']))
+        self.assertIsNone(cache.get(FOLLOW_KEY.format(self.reader.pk)))
+        self.assertNotContains(self.client.get(reverse('follow_index')),
+                               'Пост автора')
+
+    def test_follow_index_without_follow_queries(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.client.get(reverse('follow_index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('follow_index'))
+        self.assertContains(response, 'Пост автора')
+        self.assertFalse([query for query in queries
+                          if 'posts_follow' in query['sql']])
+
+    def test_follow_state_on_pages(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.get(author=self.author)
+        for url in (reverse('profile', args=['author']),
+                    reverse('post_view', args=['author', post.pk])):
+            with self.subTest(url=url):
+                self.assertTrue(self.client.get(url).context['following'])
+
+    def test_author_deletion(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(followed_ids(self.reader), {self.author.pk})
+        schedule_user_deletion(self.author)
+        process_deletions()
+        reader = User.objects.get(pk=self.reader.pk)
+        self.assertEqual(followed_ids(reader), frozenset())
+
+    def test_follows_in_a_row_kept(self):
+        other = User.objects.create_user(username='other')
+        followed_ids(self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=other)
+        reader = User.objects.get(pk=self.reader.pk)
+        self.assertEqual(followed_ids(reader), {self.author.pk, other.pk})
+
+    @override_settings(CACHES=settings.CACHES, LOCAL_CACHE_TIMEOUT=5)
+    def test_process_cache_expires(self):
+        with mock.patch.object(cache, 'set') as cache_set:
+            followed_ids(self.reader)
+        cache_set.assert_called_once_with(
+            FOLLOW_KEY.format(self.reader.pk), mock.ANY, 5)
+
+
+class CompressionTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='zip')
+        for i in range(5):
+            Post.objects.create(text='Текст поста ' * 50, author=user)
+
+    def test_gzip_html(self):
+        plain = self.client.get(reverse('index'))
+        self.assertNotIn('Content-Encoding', plain)
+        cache.clear()
+        response = self.client.get(reverse('index'),
+                                   HTTP_ACCEPT_ENCODING='gzip, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertIn('Текст поста'.encode(),
+                      gzip.decompress(response.content))
+
+    @override_settings(COMPRESS_MIN_SIZE=10 ** 7)
+    def test_small_responses_untouched(self):
+        response = self.client.get(reverse('index'),
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+
+class StaticFilesTest(TestCase):
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        with open(os.path.join(self.source, 'site.css'), 'w') as stream:
+            stream.write('body { color: red; }\n' * 200)
+
+    def tearDown(self):
+        shutil.rmtree(self.source)
+        shutil.rmtree(self.root)
+
+    def test_collect_and_serve(self):
+        with override_settings(
+                STATICFILES_DIRS=[self.source], STATIC_ROOT=self.root,
+                STATICFILES_STORAGE='yatube.staticfiles.'
+                                    'CompressedManifestStaticFilesStorage'):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            hashed = staticfiles_storage.url('site.css')
+            self.assertRegex(hashed, r'^/static/site\.[0-9a-f]{12}\.css$')
+            self.assertTrue(os.path.exists(
+                self.root + hashed[len('/static'):] + '.gz'))
+            response = self.client.get(hashed, HTTP_ACCEPT_ENCODING='gzip')
+            body = b''.join(response.streaming_content)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Content-Type'], 'text/css')
+            self.assertIn('immutable', response['Cache-Control'])
+            self.assertIn(b'color: red', gzip.decompress(body))
+            response = self.client.get('/static/site.css')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../manage.py').status_code,
+                         404)
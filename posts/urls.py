@@ -1,14 +1,27 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>', views.group_posts, name='group_posts'),
     path('new', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('export/', views.user_export, name='user_export'),
+    path('new-posts/', views.new_posts, name='new_posts'),
+    path('feeds/rss/', feeds.latest_rss, name='latest_rss'),
+    path('feeds/atom/', feeds.latest_atom, name='latest_atom'),
+    path('feeds/group/<slug:slug>/rss/', feeds.group_rss, name='group_rss'),
+    path('feeds/group/<slug:slug>/atom/', feeds.group_atom,
+         name='group_atom'),
+    path('feeds/author/<str:username>/rss/', feeds.author_rss,
+         name='author_rss'),
+    path('feeds/author/<str:username>/atom/', feeds.author_atom,
+         name='author_atom'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post_view'),
+    path('<str:username>/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'),
     path(
         '<str:username>/<int:post_id>/edit/',
         views.post_edit,
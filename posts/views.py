@@ -1,9 +1,25 @@
+from django.conf import settings
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import never_cache
 from django.core.paginator import Paginator
-from .models import Post, Group, User, Follow
+from django.utils import timezone
+from jobs.queue import enqueue
+from .models import Post, Group, User
 from .forms import PostForm, CommentForm
+from .sharding import ShardedFeed, author_posts, sharded
+from .archive import author_archive
+from .follows import follow, followed_ids, unfollow
+from .cursors import (decode_cursor, encode_cursor, feed_page, keyset_page,
+                      page_cursor)
+from . import watermarks
+from .conditional import (cached_conditional, conditional, group_validators,
+                          index_validators, page_author, page_post,
+                          post_validators, profile_validators)
+from .dump import (claim_export, release_on_failure, stream_ndjson,
+                   stream_zip)
 
 
 def page_not_found(request, exception):
@@ -19,29 +35,51 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
-@cache_page(20, key_prefix='index_page')
+def feed_fragment(request, feed, size):
+    """Только карточки следующей порции ленты и ссылка на следующую,
+    без base.html. Адрес порции определяется курсором, поэтому её
+    можно кэшировать так же, как страницу."""
+    after = request.GET['after']
+    if decode_cursor(after) is None:
+        raise Http404
+    posts, next_cursor = feed_page(feed, after, size)
+    return render(
+        request,
+        'includes/feed_cards.html',
+        {'posts': posts, 'next_cursor': next_cursor}
+    )
+
+
+@cached_conditional(index_validators, 20, key_prefix='index_page')
 def index(request):
-    post_list = Post.objects.all()
+    post_list = sharded(Post.objects.all())
+    if 'after' in request.GET:
+        return feed_fragment(request, post_list, 10)
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(
         request,
         'index.html',
-        {'page': page, 'paginator': paginator}
+        {'page': page, 'paginator': paginator,
+         'next_cursor': page_cursor(page)}
     )
 
 
+@conditional(group_validators)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.group.all()
+    post_list = sharded(Post.objects.filter(group=group))
+    if 'after' in request.GET:
+        return feed_fragment(request, post_list, 10)
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(
         request,
         'group.html',
-        {'group': group, 'page': page, 'paginator': paginator}
+        {'group': group, 'page': page, 'paginator': paginator,
+         'next_cursor': page_cursor(page)}
     )
 
 
@@ -52,6 +90,8 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        if post.image:
+            enqueue('posts.tasks.make_thumbnail', post.pk, post.author_id)
         return redirect('index')
     return render(
             request,
@@ -64,20 +104,21 @@ def new_post(request):
         )
 
 
+@conditional(profile_validators)
 def profile(request, username):
     user = request.user
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    author = page_author(request, username)
+    if author is None:
+        raise Http404
+    # архивные посты автора подмешиваются к горячим
+    post_list = ShardedFeed([author_posts(author), author_archive(author)])
+    if 'after' in request.GET:
+        return feed_fragment(request, post_list, 5)
     paginator = Paginator(post_list, 5)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     post_count = paginator.count
-    follower_count = author.follower.count()
-    following_count = author.following.count()
-    following = (
-        request.user.is_authenticated
-        and Follow.objects.filter(user=user, author=author).exists()
-    )
+    following = author.pk in followed_ids(user)
     return render(
         request,
         'profile.html',
@@ -85,46 +126,74 @@ def profile(request, username):
          'paginator': paginator,
          'author': author,
          'following': following,
-         'follower_count': follower_count,
-         'following_count': following_count,
+         'follower_count': author.follower_count,
+         'following_count': author.following_count,
          'post_count': post_count,
+         'next_cursor': page_cursor(page),
          }
     )
 
 
+def comment_page(post, after=None):
+    """Порция комментариев поста после курсора after, авторы
+    подгружаются одним запросом."""
+    return keyset_page(post.comments.prefetch_related('author'), 'created',
+                       after, getattr(settings, 'COMMENTS_PAGE_SIZE', 20))
+
+
+@conditional(post_validators)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
-    author = post.author
+    author = page_author(request, username)
+    if author is None:
+        raise Http404
+    post = page_post(request, author, post_id)
+    if post is None:
+        raise Http404
     user = request.user
-    post_count = author.posts.count()
-    follower_count = author.follower.count()
-    following_count = author.following.count()
     form = CommentForm()
-    following = False
-    if user.is_authenticated:
-        if user.follower.filter(user=user, author=author).exists():
-            following = True
-    items = post.comments.all()
+    following = author.pk in followed_ids(user)
+    items, next_cursor = comment_page(post)
     return render(
         request,
         'post.html',
-        {'post_count': post_count,
+        {'post_count': post.post_count,
          'author': author,
          'post': post,
          'items': items,
+         'next_cursor': next_cursor,
          'form': form,
          'following': following,
-         'follower_count': follower_count,
-         'following_count': following_count,
+         'follower_count': author.follower_count,
+         'following_count': author.following_count,
          'user': user,
          }
     )
 
 
+def post_comments(request, username, post_id):
+    after = request.GET.get('after')
+    if not after or decode_cursor(after) is None:
+        raise Http404
+    author = get_object_or_404(User, username=username)
+    post = author_posts(author).filter(id=post_id).first()
+    if post is None:
+        post = get_object_or_404(author_archive(author), id=post_id)
+    items, next_cursor = comment_page(post, after)
+    return render(
+        request,
+        'includes/comment_items.html',
+        {'author': author,
+         'post': post,
+         'items': items,
+         'next_cursor': next_cursor,
+         }
+    )
+
+
 @login_required
 def post_edit(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
-    author = post.author
+    author = get_object_or_404(User, username=username)
+    post = get_object_or_404(author_posts(author), id=post_id)
     if author != request.user:
         return redirect(
             'post_view',
@@ -136,6 +205,8 @@ def post_edit(request, username, post_id):
     if form.is_valid():
         post = form.save(commit=False)
         post.save()
+        if 'image' in form.changed_data and post.image:
+            enqueue('posts.tasks.make_thumbnail', post.pk, post.author_id)
         return redirect(
             'post_view',
             username=author.username,
@@ -155,49 +226,109 @@ def post_edit(request, username, post_id):
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, id=post_id, author__username=username)
+    author = get_object_or_404(User, username=username)
+    post = get_object_or_404(author_posts(author), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
         comment.author = request.user
         comment.save()
+        # число комментариев видно в ленте, её ETag зависит от updated
+        author_posts(author).filter(pk=post.pk).update(
+            updated=timezone.now())
         return redirect('post_view', username=username, post_id=post_id)
     return redirect('post_view', post_id=post_id, username=username)
 
 
 @login_required
 def follow_index(request):
-    user_follows = (
-        User
-        .objects
-        .get(id=request.user.id)
-        .follower
-        .all()
-        .values_list('author')
-    )
-    post_list = Post.objects.filter(author__in=user_follows)
+    user_follows = followed_ids(request.user)
+    post_list = sharded(Post.objects.filter(author__in=user_follows))
+    if 'after' in request.GET:
+        return feed_fragment(request, post_list, 10)
     paginator = Paginator(post_list, 10)
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return render(
         request,
         'follow.html',
-        {'page': page, 'paginator': paginator}
+        {'page': page, 'paginator': paginator,
+         'next_cursor': page_cursor(page)}
     )
 
 
+@never_cache
+def new_posts(request):
+    """Сколько постов в ленте новее курсора since.
+
+    Пока отметка ленты в кэше не новее since, база не нужна.
+    Без since возвращает только курсор самого нового поста.
+    """
+    feed = request.GET.get('feed', 'index')
+    if feed == 'index':
+        feeds = [watermarks.index_feed()]
+    elif feed == 'group':
+        feeds = [watermarks.group_feed(request.GET.get('slug', ''))]
+    elif feed == 'follow':
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'login required'}, status=403)
+        author_ids = followed_ids(request.user)
+        feeds = watermarks.follow_feeds(author_ids)
+    else:
+        return JsonResponse({'error': 'unknown feed'}, status=400)
+    since = request.GET.get('since')
+    cursor = decode_cursor(since) if since else None
+    if since and cursor is None:
+        return JsonResponse({'error': 'bad cursor'}, status=400)
+    newest = watermarks.newest_mark(feeds)
+    data = {'count': 0,
+            'newest': encode_cursor(*newest) if newest else None}
+    if cursor is None or newest is None or newest <= cursor:
+        return JsonResponse(data)
+    if feed == 'follow':
+        counted = [sharded(Post.objects.filter(author__in=author_ids))]
+    else:
+        counted = [queryset for _, queryset in feeds]
+    limit = getattr(settings, 'NEW_POSTS_LIMIT', 99)
+    count = sum(watermarks.count_newer(queryset, cursor, limit)
+                for queryset in counted)
+    data.update(count=min(count, limit), more=count > limit)
+    return JsonResponse(data)
+
+
 @login_required
 def profile_follow(request, username):
     author = User.objects.get(username=username)
     user = request.user
     if user != author:
-        Follow.objects.get_or_create(user=user, author=author)
+        follow(user, author)
     return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = User.objects.get(username=username)
-    Follow.objects.filter(user=request.user, author=author,).delete()
-    return redirect('profile', username=username)
\ No newline at end of file
+    unfollow(request.user, author)
+    return redirect('profile', username=username)
+
+
+@login_required
+def user_export(request):
+    user = request.user
+    # не чаще одной выгрузки за USER_EXPORT_INTERVAL секунд
+    started = claim_export(user.pk, settings.USER_EXPORT_INTERVAL)
+    if started is None:
+        return HttpResponse('Повторите выгрузку позже', status=429)
+    if request.GET.get('format') == 'zip':
+        stream, content_type = stream_zip(user), 'application/zip'
+        filename = f'{user.username}.zip'
+    else:
+        stream = stream_ndjson(user)
+        content_type = 'application/x-ndjson'
+        filename = f'{user.username}.ndjson'
+    response = StreamingHttpResponse(
+        release_on_failure(stream, user.pk, started),
+        content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,123 @@
+"""Отметки самого нового поста в лентах для опроса "есть ли новые".
+
+Для каждой ленты (вся, группы, автора) в кэше лежит курсор её
+самого нового поста. Сохранение поста сдвигает отметки, поэтому
+опрос сравнивает курсор клиента с отметкой и идёт в базу, только
+когда новые посты действительно есть. Сдвиг отметки должны видеть все
+процессы, поэтому с кэшем процесса отметки каждый раз берутся из базы:
+по запросу на шард по индексу pub_date, для подписок - тоже один на
+шард, а не на каждого автора.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from yatube.caches import is_shared
+
+from .cursors import decode_cursor, encode_cursor, newer_than
+from .models import Group, Post
+from .sharding import feed_key, shard_for, sharded
+
+KEY = 'feed_mark:{}'
+EMPTY = ''
+
+
+def timeout():
+    return getattr(settings, 'FEED_MARK_TIMEOUT', 60 * 60)
+
+
+def index_feed():
+    return 'index', sharded(Post.objects.all())
+
+
+class GroupFeed:
+    """Посты группы на всех шардах. Группы есть только в default, на
+    шардах их не с чем соединять, поэтому id группы ищется заранее -
+    и только когда отметки нет в кэше."""
+
+    def __init__(self, slug):
+        self.slug = slug
+
+    @cached_property
+    def querysets(self):
+        group_id = Group.objects.filter(slug=self.slug).values_list(
+            'pk', flat=True).first()
+        if group_id is None:
+            return []
+        return querysets(sharded(Post.objects.filter(group_id=group_id)))
+
+
+def group_feed(slug):
+    return f'group:{slug}', GroupFeed(slug)
+
+
+def author_feed(author_id):
+    return (f'author:{author_id}', Post.objects.using(
+        shard_for(author_id)).filter(author_id=author_id))
+
+
+def follow_feeds(author_ids):
+    """Ленты авторов из подписок: с общим кэшем отметка у каждого
+    автора своя, без него все авторы берутся одним запросом на шард."""
+    if is_shared():
+        return [author_feed(pk) for pk in author_ids]
+    return [('follow', sharded(Post.objects.filter(author__in=author_ids)))]
+
+
+def querysets(feed):
+    return getattr(feed, 'querysets', [feed])
+
+
+def newest(feed):
+    keys = [key for key in (
+        qs.order_by('-pub_date', '-pk').values_list('pub_date', 'pk').first()
+        for qs in querysets(feed)) if key]
+    return encode_cursor(*max(keys)) if keys else EMPTY
+
+
+def marks(feeds):
+    """Отметки лент {имя: курсор}; недостающие считаются и кэшируются."""
+    if not is_shared():
+        return {name: newest(feed) for name, feed in feeds}
+    found = cache.get_many([KEY.format(name) for name, _ in feeds])
+    result, missing = {}, {}
+    for name, feed in feeds:
+        mark = found.get(KEY.format(name))
+        if mark is None:
+            mark = missing[KEY.format(name)] = newest(feed)
+        result[name] = mark
+    if missing:
+        cache.set_many(missing, timeout())
+    return result
+
+
+def newest_mark(feeds):
+    """Самая новая из отметок лент: (дата, id) или None."""
+    cursors = [decode_cursor(mark) for mark in marks(feeds).values()
+               if mark]
+    return max(cursors) if cursors else None
+
+
+def count_newer(feed, cursor, limit):
+    """Число постов новее cursor, не больше limit + 1."""
+    return sum(
+        qs.filter(newer_than('pub_date', cursor))[:limit + 1].count()
+        for qs in querysets(feed))
+
+
+@receiver(post_save, sender=Post, dispatch_uid='feed_marks')
+def bump_marks(sender, instance, created, raw=False, **kwargs):
+    if raw or not is_shared():
+        return
+    group = f'group:{instance.group.slug}' if instance.group_id else None
+    if not created:
+        # при правке пост мог перейти в другую группу, отметка
+        # пересчитается при следующем опросе
+        if group:
+            cache.delete(KEY.format(group))
+        return
+    names = ['index', f'author:{instance.author_id}'] + (
+        [group] if group else [])
+    mark = encode_cursor(*feed_key(instance))
+    cache.set_many({KEY.format(name): mark for name in names}, timeout())
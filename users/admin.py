@@ -1,3 +1,27 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
 
-# Register your models here.
+from posts.deletion import schedule_user_deletion
+
+User = get_user_model()
+
+
+class DeferredDeleteUserAdmin(UserAdmin):
+    """Удаление из админки только ставит пользователя в очередь,
+    сами строки удаляет manage.py process_deletions."""
+
+    def get_deleted_objects(self, objs, request):
+        # не собираем все связанные объекты для страницы подтверждения
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        schedule_user_deletion(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            schedule_user_deletion(user)
+
+
+admin.site.unregister(User)
+admin.site.register(User, DeferredDeleteUserAdmin)
@@ -0,0 +1,52 @@
+"""Пользователь запроса из кэша.
+
+Пользователь кэшируется по id и подходит запросу, только если хэш в
+сессии совпадает с выведенным из хэша его пароля; иначе запрос идёт
+по обычному пути django.contrib.auth. Любое сохранение и удаление
+пользователя сбрасывает кэш сигналами, update() мимо модели - вызовом
+forget_user. Сброс виден всем процессам только в общем кэше, поэтому
+с кэшем процесса пользователь не кэшируется.
+"""
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from yatube.caches import is_shared
+
+KEY = 'auth_user:{}'
+
+
+def get_user(request):
+    session = request.session
+    user_id = session.get(auth.SESSION_KEY)
+    session_hash = session.get(auth.HASH_SESSION_KEY)
+    if user_id is None or session_hash is None or not is_shared():
+        return auth.get_user(request)
+    key = KEY.format(user_id)
+    user = cache.get(key)
+    if user is not None and constant_time_compare(
+            session_hash, user.get_session_auth_hash()):
+        return user
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        cache.set(key, user,
+                  getattr(settings, 'USER_CACHE_TIMEOUT', 60 * 60))
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL,
+          dispatch_uid='cached_user')
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL,
+          dispatch_uid='cached_user')
+def forget_user(instance, **kwargs):
+    cache.delete(KEY.format(instance.pk))
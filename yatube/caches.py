@@ -0,0 +1,29 @@
+"""Общий кэш или кэш процесса.
+
+У LocMemCache каждый процесс держит свою копию, и сброс ключа сигналом
+виден только процессу, который его сделал. Поэтому данные, которые
+сбрасываются сигналами, надолго кэшируются только в общем кэше
+(memcached, база). С кэшем процесса они не кэшируются вовсе или живут
+не дольше LOCAL_CACHE_TIMEOUT секунд.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_shared(cache=None):
+    """Видят ли записи в cache все процессы сайта и воркеры."""
+    if cache is None:
+        cache = caches['default']
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def timeout(name, default):
+    """Срок из настройки name, с кэшем процесса - не больше
+    LOCAL_CACHE_TIMEOUT."""
+    value = getattr(settings, name, default)
+    if is_shared():
+        return value
+    local = getattr(settings, 'LOCAL_CACHE_TIMEOUT', 10)
+    return local if value is None else min(value, local)
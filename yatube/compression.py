@@ -0,0 +1,86 @@
+"""Сжатие ответов gzip и brotli.
+
+brotli - необязательная зависимость: без пакета brotli остаётся gzip.
+"""
+import gzip
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_token = re.compile(r'\s*([a-z0-9*-]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml')
+
+
+def accepted_encodings(request):
+    """Кодировки из Accept-Encoding, кроме запрещённых через q=0."""
+    accepted = set()
+    header = request.META.get('HTTP_ACCEPT_ENCODING', '').lower()
+    for part in header.split(','):
+        match = _token.match(part)
+        if not match:
+            continue
+        try:
+            weight = float(match.group(2) or 1)
+        except ValueError:
+            continue
+        if weight > 0:
+            accepted.add(match.group(1))
+    return accepted
+
+
+def choose_encoding(request):
+    accepted = accepted_encodings(request)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=getattr(
+            settings, 'COMPRESS_BROTLI_QUALITY', 5))
+    return gzip.compress(data, compresslevel=getattr(
+        settings, 'COMPRESS_GZIP_LEVEL', 6))
+
+
+class CompressionMiddleware:
+    """Сжимает HTML и другие текстовые ответы от COMPRESS_MIN_SIZE байт."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.status_code != 200
+                or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(
+                    COMPRESSIBLE_TYPES)):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'COMPRESS_MIN_SIZE',
+                                           1024):
+            return response
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # сжатое тело другое побайтно, сильный ETag становится слабым
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,134 @@
+"""Счётчики текущего запроса: SQL, кэш, рендер шаблонов.
+
+Статистика живёт в contextvar, его заводит ServerTimingMiddleware.
+Вне запроса (воркер, manage.py) счётчики просто не ведутся.
+"""
+import contextvars
+import re
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.memcached import MemcachedCache
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+from .querylog import querylog
+
+current = contextvars.ContextVar('request_stats', default=None)
+
+_MISSING = object()
+
+# префикс вида 'имя:' или 'имя||' (ключи sorl-thumbnail)
+_PREFIX = re.compile(r'([\w.-]{1,40})(?::|\|\|)')
+
+
+class RequestStats:
+    __slots__ = ('request', 'db_count', 'db_time', 'cache_hits',
+                 'cache_misses', 'template_time', 'template_depth')
+
+    def __init__(self, request=None):
+        self.request = request
+        self.db_count = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+
+def url_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '-'
+    return match.url_name or match.view_name or '-'
+
+
+def query_timer(execute, sql, params, many, context):
+    stats = current.get()
+    # EXPLAIN медленного запроса - не запрос страницы
+    if stats is None or querylog.explaining():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        stats.db_count += 1
+        stats.db_time += elapsed
+        querylog.record(sql, params, elapsed, url_name(stats.request),
+                        context['connection'])
+
+
+def cache_label(key):
+    """Префикс ключа: key_prefix для cache_page, иначе часть до ':'.
+    Ключи без префикса попадают в 'other', иначе каждый ключ стал бы
+    отдельной серией метрик."""
+    if key.startswith('views.decorators.cache.'):
+        return key.split('.')[4]
+    match = _PREFIX.match(key)
+    return match.group(1) if match else 'other'
+
+
+class CacheStatsMixin:
+    """Считает попадания и промахи get/get_many любого бэкенда кэша."""
+
+    def _count(self, key, hit):
+        stats = current.get()
+        if stats is not None:
+            if hit:
+                stats.cache_hits += 1
+            else:
+                stats.cache_misses += 1
+        metrics.inc('cache_hits_total' if hit else 'cache_misses_total',
+                    cache=cache_label(key))
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        self._count(key, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        for key in keys:
+            self._count(key, key in found)
+        return found
+
+
+class InstrumentedLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedMemcachedCache(CacheStatsMixin, MemcachedCache):
+    pass
+
+
+class InstrumentedDatabaseCache(CacheStatsMixin, DatabaseCache):
+    pass
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(context, request)
+        # вложенные render_to_string не считаем второй раз
+        stats.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self)
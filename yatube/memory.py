@@ -0,0 +1,124 @@
+"""Диагностика памяти на tracemalloc.
+
+Включается настройкой MEMORY_TRACE_FRAMES (глубина стека выделений,
+0 - выключено). Процесс раз в MEMORY_SNAPSHOT_INTERVAL секунд снимает
+снимок, отчёт сравнивает последний снимок с первым по местам выделения.
+Отчёт доступен персоналу на /debug/memory и пишется в лог по SIGUSR2.
+Пик памяти запроса MemoryMiddleware пишет в метрики по имени URL;
+tracemalloc считает весь процесс, так что при нескольких потоках
+пик включает и соседние запросы.
+"""
+import linecache
+import logging
+import signal
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from . import metrics
+from .instrumentation import url_name
+
+logger = logging.getLogger('yatube.memory')
+
+
+class SnapshotTracker:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.baseline = None
+        self.latest = None
+        self.thread = None
+
+    def take(self):
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, linecache.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        with self.lock:
+            if self.baseline is None:
+                self.baseline = snapshot
+            self.latest = snapshot
+        return snapshot
+
+    def diff(self, limit=20, key_type='lineno'):
+        """Места выделения с наибольшим ростом от первого снимка."""
+        with self.lock:
+            baseline, latest = self.baseline, self.latest
+        if baseline is None:
+            return []
+        return latest.compare_to(baseline, key_type)[:limit]
+
+    def run(self, interval):
+        while True:
+            if tracemalloc.is_tracing():
+                self.take()
+            time.sleep(interval)
+
+    def start(self, interval):
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self.run, args=(interval,), daemon=True)
+            self.thread.start()
+
+
+tracker = SnapshotTracker()
+
+
+def enable():
+    """Запускает трассировку, снимки и обработчик SIGUSR2, если включено."""
+    frames = getattr(settings, 'MEMORY_TRACE_FRAMES', 0)
+    if not frames:
+        return False
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    tracker.start(getattr(settings, 'MEMORY_SNAPSHOT_INTERVAL', 300))
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGUSR2,
+                      lambda *args: logger.warning('%s', report()))
+    return True
+
+
+def report(limit=20, key_type='lineno'):
+    if not tracemalloc.is_tracing():
+        return 'tracemalloc выключен, задайте MEMORY_TRACE_FRAMES\n'
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f'current={current / 1024:.0f}KiB peak={peak / 1024:.0f}KiB',
+             '', f'Рост с первого снимка по {key_type}:']
+    tracker.take()
+    lines += [str(stat) for stat in tracker.diff(limit, key_type)]
+    lines += ['', 'Крупнейшие места выделения сейчас:']
+    lines += [str(stat) for stat
+              in tracker.latest.statistics(key_type)[:limit]]
+    return '\n'.join(lines) + '\n'
+
+
+@staff_member_required
+def memory_view(request):
+    key_type = request.GET.get('by', 'lineno')
+    if key_type not in ('lineno', 'filename', 'traceback'):
+        key_type = 'lineno'
+    limit = request.GET.get('limit', '')
+    limit = int(limit) if limit.isdigit() else 20
+    return HttpResponse(report(limit, key_type),
+                        content_type='text/plain; charset=utf-8')
+
+
+class MemoryMiddleware:
+    def __init__(self, get_response):
+        if not enable():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        response = self.get_response(request)
+        peak = tracemalloc.get_traced_memory()[1] - start
+        metrics.observe('request_peak_memory_bytes', peak,
+                        view=url_name(request))
+        return response
@@ -0,0 +1,188 @@
+"""Метрики процесса в формате Prometheus.
+
+Каждый процесс копит счётчики и гистограммы в памяти. Если задан
+METRICS_DIR, процесс раз в METRICS_FLUSH_INTERVAL секунд сбрасывает
+свой снимок в файл <pid>.json, а /metrics суммирует файлы всех
+процессов, так что внешний агрегатор не нужен.
+
+За обратным прокси все запросы приходят с 127.0.0.1, поэтому адрес
+клиента доступ не даёт: /metrics открыт персоналу и запросам с
+заголовком Authorization: Bearer <METRICS_TOKEN>.
+"""
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+MEMORY_BUCKETS = tuple(2 ** power * 1024 for power in range(0, 20, 2))
+
+METRICS = {
+    'http_requests_total': ('counter', 'Запросы по имени URL и статусу'),
+    'http_errors_total': ('counter', 'Ответы 5xx по имени URL'),
+    'http_request_duration_seconds': (
+        'histogram', 'Время ответа по имени URL', LATENCY_BUCKETS),
+    'db_queries_per_request': (
+        'histogram', 'Число SQL-запросов на запрос', QUERY_BUCKETS),
+    'cache_hits_total': ('counter', 'Попадания в кэш по префиксу ключа'),
+    'cache_misses_total': ('counter', 'Промахи кэша по префиксу ключа'),
+    'thumbnails_generated_total': ('counter', 'Созданные миниатюры'),
+    'request_peak_memory_bytes': (
+        'histogram', 'Пик выделенной памяти за запрос', MEMORY_BUCKETS),
+}
+PREFIX = 'yatube_'
+
+
+def label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, label_key(labels))
+        with self.lock:
+            data = self.histograms.get(key)
+            if data is None:
+                data = self.histograms[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[0][i] += 1
+                    break
+            data[1] += value
+            data[2] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value
+                             in self.counters.items()],
+                'histograms': [[name, labels, data[0][:], data[1], data[2]]
+                               for (name, labels), data
+                               in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed < interval):
+            return
+        self.flushed = now
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as stream:
+            json.dump(self.snapshot(), stream)
+        os.replace(path + '.tmp', path)
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+def collect():
+    """Снимки всех процессов, или только текущего без METRICS_DIR."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return [registry.snapshot()]
+    registry.flush(force=True)
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as stream:
+                snapshots.append(json.load(stream))
+    return snapshots
+
+
+def merge(snapshots):
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            data = histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            data[0] = [a + b for a, b in zip(data[0], buckets)]
+            data[1] += total
+            data[2] += count
+    return counters, histograms
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    inner = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+        for k, v in pairs)
+    return '{' + inner + '}'
+
+
+def exposition(snapshots):
+    counters, histograms = merge(snapshots)
+    lines = []
+    for name, spec in METRICS.items():
+        kind, help_text = spec[0], spec[1]
+        full = PREFIX + name
+        lines.append(f'# HELP {full} {help_text}')
+        lines.append(f'# TYPE {full} {kind}')
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f'{full}{format_labels(labels)} {value}')
+            continue
+        for (metric, labels), (buckets, total, count) in sorted(
+                histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, bucket in zip(spec[2], buckets):
+                cumulative += bucket
+                lines.append(f'{full}_bucket'
+                             f'{format_labels(labels, le=bound)} {cumulative}')
+            lines.append(
+                f'{full}_bucket{format_labels(labels, le="+Inf")} {count}')
+            lines.append(f'{full}_sum{format_labels(labels)} {total}')
+            lines.append(f'{full}_count{format_labels(labels)} {count}')
+    # доля попаданий считается из счётчиков для удобства дашбордов
+    full = PREFIX + 'cache_hit_ratio'
+    lines.append(f'# HELP {full} Доля попаданий в кэш по префиксу ключа')
+    lines.append(f'# TYPE {full} gauge')
+    for (metric, labels), hits in sorted(counters.items()):
+        if metric != 'cache_hits_total':
+            continue
+        misses = counters.get(('cache_misses_total', labels), 0)
+        lines.append(
+            f'{full}{format_labels(labels)} {hits / (hits + misses):.4f}')
+    return '\n'.join(lines) + '\n'
+
+
+def has_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics_view(request):
+    if not (has_token(request) or request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(collect()),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,61 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+
+from . import metrics
+from .instrumentation import RequestStats, current, query_timer, url_name
+from .querylog import querylog
+
+logger = logging.getLogger('yatube.requests')
+
+
+class ServerTimingMiddleware:
+    """Отдаёт время SQL, кэша, шаблонов и view в заголовке Server-Timing,
+    пишет его же строкой лога с именем URL и копит метрики запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = RequestStats(request)
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(query_timer))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        total = time.perf_counter() - started
+        name = url_name(request)
+        self.record_metrics(name, response.status_code, total, stats)
+        response['Server-Timing'] = (
+            f'db;dur={stats.db_time * 1000:.2f};'
+            f'desc="{stats.db_count} queries", '
+            f'cache;desc="{stats.cache_hits} hits '
+            f'{stats.cache_misses} misses", '
+            f'tpl;dur={stats.template_time * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+        logger.info(
+            'url=%s method=%s status=%s total_ms=%.2f db_queries=%d '
+            'db_ms=%.2f cache_hits=%d cache_misses=%d tpl_ms=%.2f',
+            name, request.method, response.status_code,
+            total * 1000, stats.db_count, stats.db_time * 1000,
+            stats.cache_hits, stats.cache_misses,
+            stats.template_time * 1000,
+        )
+        return response
+
+    def record_metrics(self, name, status, total, stats):
+        metrics.inc('http_requests_total', view=name, status=status)
+        if status >= 500:
+            metrics.inc('http_errors_total', view=name)
+        metrics.observe('http_request_duration_seconds', total, view=name)
+        metrics.observe('db_queries_per_request', stats.db_count, view=name)
+        metrics.registry.flush()
+        querylog.flush()
@@ -0,0 +1,126 @@
+"""Выборочное профилирование запросов в продакшене.
+
+ProfilingMiddleware профилирует каждый PROFILE_SAMPLE_RATE-й запрос
+(в среднем) или запрос с подписанным заголовком X-Profile-Token.
+Результаты ложатся в PROFILE_DIR/<имя URL>/: в режиме 'sample' - свёрнутые
+стеки (.folded), в режиме 'cprofile' - файлы pstats (.prof).
+manage.py profile_report объединяет их в отчёт для flame graph.
+"""
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+from .instrumentation import url_name
+
+HEADER = 'HTTP_X_PROFILE_TOKEN'
+SALT = 'yatube.profiling'
+
+
+def profile_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(token):
+    max_age = getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600)
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return (f'{code.co_name} '
+            f'({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+
+
+class StackSampler:
+    """Раз в interval секунд снимает стек потока, который ведёт запрос."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(frame_label(frame).replace(';', ':'))
+                frame = frame.f_back
+            if labels:
+                self.stacks[';'.join(reversed(labels))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path):
+        with open(path + '.folded', 'w') as stream:
+            for stack, count in self.stacks.items():
+                stream.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path + '.prof')
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.directory = getattr(settings, 'PROFILE_DIR', None)
+        if not self.directory:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        self.mode = getattr(settings, 'PROFILE_MODE', 'sample')
+
+    def should_profile(self, request):
+        token = request.META.get(HEADER)
+        if token:
+            return valid_token(token)
+        return self.rate > 0 and random.randrange(self.rate) == 0
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        if self.mode == 'cprofile':
+            profiler = CProfiler()
+        else:
+            profiler = StackSampler(
+                getattr(settings, 'PROFILE_INTERVAL', 0.005))
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        directory = os.path.join(self.directory, url_name(request))
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump(os.path.join(
+            directory, f'{time.time():.3f}-{os.getpid()}-'
+                       f'{threading.get_ident()}'))
+        return response
@@ -0,0 +1,156 @@
+"""Агрегированная статистика SQL по отпечаткам запросов.
+
+Запросы приходят из ServerTimingMiddleware. Литералы из SQL убираются,
+так что запросы, различающиеся только значениями, складываются вместе.
+Медленные запросы пишутся в лог вместе с планом EXPLAIN. Снимки
+процессов сбрасываются в METRICS_DIR/queries, manage.py top_queries
+их объединяет.
+"""
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger('yatube.slow_queries')
+
+SAMPLES = 200
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \((?:\s*(?:\?|%s)\s*,)*\s*(?:\?|%s)\s*\)',
+                      re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class QueryLog:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.local = threading.local()
+        self.flushed = 0.0
+
+    def explaining(self):
+        return getattr(self.local, 'explaining', False)
+
+    def record(self, sql, params, duration, view, connection=None):
+        if self.explaining():
+            return
+        key = (fingerprint(sql), view)
+        with self.lock:
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = [0, 0.0, deque(maxlen=SAMPLES)]
+            entry[0] += 1
+            entry[1] += duration
+            entry[2].append(duration)
+        slow_ms = getattr(settings, 'QUERYLOG_SLOW_MS', 100)
+        if duration * 1000 >= slow_ms:
+            self.log_slow(sql, params, duration, view, connection)
+
+    def log_slow(self, sql, params, duration, view, connection):
+        plan = ''
+        if (connection is not None
+                and sql.lstrip().upper().startswith('SELECT')):
+            # сам EXPLAIN проходит через ту же обёртку, его не считаем
+            self.local.explaining = True
+            try:
+                prefix = ('EXPLAIN QUERY PLAN'
+                          if connection.vendor == 'sqlite' else 'EXPLAIN')
+                with connection.cursor() as cursor:
+                    cursor.execute(f'{prefix} {sql}', params)
+                    plan = '; '.join(
+                        ' '.join(map(str, row)) for row in cursor.fetchall())
+            except Exception as error:
+                plan = f'EXPLAIN failed: {error}'
+            finally:
+                self.local.explaining = False
+        logger.warning('view=%s ms=%.1f sql=%s plan=%s',
+                       view, duration * 1000, fingerprint(sql), plan)
+
+    def snapshot(self):
+        with self.lock:
+            return [[sql, view, count, total, list(samples)]
+                    for (sql, view), (count, total, samples)
+                    in self.stats.items()]
+
+    def flush(self, force=False):
+        directory = getattr(settings, 'METRICS_DIR', None)
+        interval = getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+        now = time.monotonic()
+        if not directory or (not force and now - self.flushed < interval):
+            return
+        self.flushed = now
+        directory = os.path.join(directory, 'queries')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as stream:
+            json.dump(self.snapshot(), stream)
+        os.replace(path + '.tmp', path)
+
+
+querylog = QueryLog()
+
+
+def collect(own=True):
+    """Снимки всех процессов, или только текущего без METRICS_DIR.
+    own=False - без снимка текущего процесса (для manage.py)."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return [querylog.snapshot()] if own else []
+    if own:
+        querylog.flush(force=True)
+    directory = os.path.join(directory, 'queries')
+    if not os.path.isdir(directory):
+        return []
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name)) as stream:
+                snapshots.append(json.load(stream))
+    return snapshots
+
+
+def top(snapshots, by='total', limit=20, view=None):
+    """Сводка по отпечаткам: count, total, p99 и самые тяжёлые view."""
+    merged = {}
+    for snapshot in snapshots:
+        for sql, query_view, count, total, samples in snapshot:
+            if view is not None and query_view != view:
+                continue
+            entry = merged.setdefault(
+                sql, {'sql': sql, 'count': 0, 'total': 0.0,
+                      'samples': [], 'views': {}})
+            entry['count'] += count
+            entry['total'] += total
+            entry['samples'].extend(samples)
+            entry['views'][query_view] = (
+                entry['views'].get(query_view, 0.0) + total)
+    rows = []
+    for entry in merged.values():
+        entry['p99'] = percentile(entry.pop('samples'), 0.99)
+        entry['views'] = sorted(entry['views'].items(),
+                                key=lambda item: -item[1])
+        rows.append(entry)
+    rows.sort(key=lambda entry: -entry[by])
+    return rows[:limit]
@@ -0,0 +1,89 @@
+"""Сессии в кэше с отложенной записью в базу.
+
+SESSION_ENGINE = 'yatube.sessions'. Чтение идёт из кэша, при промахе -
+из django_session, как у cached_db. Сохранение пишет только в кэш и
+не чаще раза в SESSION_WRITE_BEHIND_DELAY секунд ставит задачу persist,
+которая переносит сессию из кэша в базу. Создание и удаление сессии
+(вход и выход) пишутся в базу сразу. Сохранение без изменения данных
+пропускается.
+
+Воркер и другие процессы сайта читают сессию из того же кэша, поэтому
+кэш используется только общий (memcached, redis). С кэшем процесса
+выход в одном процессе не был бы виден остальным, и хранилище работает
+как db: читает и пишет django_session напрямую. С
+SESSION_WRITE_BEHIND_DELAY = None сессия пишется в базу сразу.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import UpdateError
+from django.contrib.sessions.backends.cached_db import \
+    SessionStore as CachedDBStore
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from jobs.queue import enqueue
+from yatube.caches import is_shared
+
+KEY_PREFIX = 'yatube.sessions:'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = KEY_PREFIX
+
+    def backend(self):
+        """Реализация хранилища: cached_db с общим кэшем, иначе db."""
+        return CachedDBStore if is_shared(self._cache) else DBStore
+
+    def write_behind_delay(self):
+        if not is_shared(self._cache):
+            return None
+        return getattr(settings, 'SESSION_WRITE_BEHIND_DELAY', 60)
+
+    def exists(self, session_key):
+        return self.backend().exists(self, session_key)
+
+    def delete(self, session_key=None):
+        self.backend().delete(self, session_key)
+
+    def load(self):
+        data = self.backend().load(self)
+        self._saved = self.encode(data)
+        return data
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            self.backend().save(self, must_create)
+            self._saved = self.encode(self._session)
+            return
+        data = self._get_session()
+        encoded = self.encode(data)
+        if encoded == getattr(self, '_saved', None):
+            return
+        delay = self.write_behind_delay()
+        if delay is None:
+            self.backend().save(self)
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+            self.schedule_persist(delay)
+        self._saved = encoded
+
+    def schedule_persist(self, delay):
+        pending = f'{KEY_PREFIX}pending:{self.session_key}'
+        if not self._cache.add(pending, True, delay):
+            return
+        job = enqueue('yatube.sessions.persist', self.session_key,
+                      delay=delay, key=f'session:{self.session_key}')
+        if job is None:
+            # прошлая задача ещё держит ключ, повторим при следующем save
+            self._cache.delete(pending)
+
+
+def persist(session_key):
+    """Переносит сессию из кэша в базу; истёкшую или удалённую
+    пропускает."""
+    store = SessionStore(session_key)
+    data = store._cache.get(store.cache_key)
+    if data is None:
+        return
+    store._session_cache = data
+    try:
+        DBStore.save(store)
+    except UpdateError:
+        pass
@@ -36,6 +36,7 @@ ALLOWED_HOSTS = [
 INSTALLED_APPS = [
     'users',
     'posts',
+    'jobs',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -44,17 +45,22 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django.contrib.sites',
     'django.contrib.flatpages',
+    'django.contrib.sitemaps',
     'sorl.thumbnail',
 ]
 
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'yatube.middleware.ServerTimingMiddleware',
+    'yatube.compression.CompressionMiddleware',
+    'yatube.profiling.ProfilingMiddleware',
+    'yatube.memory.MemoryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.auth.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,12 +69,24 @@ ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# В продакшене шаблоны компилируются один раз: кэширующий загрузчик
+# заполняется при прогреве воркера (yatube.warmup), проверка и замер -
+# manage.py compile_templates
+if not DEBUG:
+    TEMPLATE_LOADERS = [
+        ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+    ]
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.instrumentation.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -92,6 +110,18 @@ DATABASES = {
     }
 }
 
+# Посты и комментарии шардируются по id автора между этими алиасами
+# из DATABASES. После изменения списка запустить manage.py reshard
+POST_SHARDS = ['default']
+
+DATABASE_ROUTERS = ['posts.routers.PostShardRouter']
+
+# Посты старше этого срока переносит в архив manage.py archive_posts
+POST_ARCHIVE_AFTER_DAYS = 365
+
+# Пауза в секундах между выгрузками данных одного пользователя
+USER_EXPORT_INTERVAL = 60 * 60
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -128,6 +158,51 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# В продакшене имена файлов статики содержат хэш, collectstatic кладёт
+# рядом сжатые .gz/.br, их отдаёт yatube.staticfiles.serve_static
+if not DEBUG:
+    STATICFILES_STORAGE = (
+        'yatube.staticfiles.CompressedManifestStaticFilesStorage')
+
+# Сжатие ответов: HTML и другой текст от COMPRESS_MIN_SIZE байт,
+# brotli - если установлен пакет brotli
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_GZIP_LEVEL = 6
+COMPRESS_BROTLI_QUALITY = 5
+
+# комментарии на странице поста выдаются порциями по курсору
+COMMENTS_PAGE_SIZE = 20
+
+# Опрос новых постов (/new-posts/): отметки лент живут в общем кэше
+# FEED_MARK_TIMEOUT секунд, счётчик ограничен NEW_POSTS_LIMIT
+FEED_MARK_TIMEOUT = 60 * 60
+NEW_POSTS_LIMIT = 99
+
+# RSS и Atom (/feeds/...): число записей и время жизни готового XML
+SYNDICATION_ITEMS = 20
+SYNDICATION_CACHE_TIMEOUT = 10 * 60
+
+# Карта сайта (/sitemap.xml): посты и профили нарезаются на куски
+# по SITEMAP_CHUNK_SIZE id, XML кусков хранится SITEMAP_CACHE_TIMEOUT
+# секунд и строится заранее manage.py generate_sitemaps
+SITEMAP_CHUNK_SIZE = 10000
+SITEMAP_CACHE_TIMEOUT = 24 * 60 * 60
+SITEMAP_PROTOCOL = 'https'
+
+# flatpages (about/, terms/ ...) отдаются из кэша, сброс - по сигналам
+# FlatPage; None - без срока (с кэшем процесса - LOCAL_CACHE_TIMEOUT)
+FLATPAGE_CACHE_TIMEOUT = None
+
+# Сессии читаются из кэша и пишутся в базу отложенно (yatube.sessions),
+# пользователь запроса берётся из кэша (users.auth); с кэшем процесса
+# оба работают через базу
+SESSION_ENGINE = 'yatube.sessions'
+SESSION_WRITE_BEHIND_DELAY = 60
+USER_CACHE_TIMEOUT = 60 * 60
+
+# id авторов, на которых подписан пользователь (posts.follows); с кэшем
+# процесса - не дольше LOCAL_CACHE_TIMEOUT
+FOLLOW_CACHE_TIMEOUT = 24 * 60 * 60
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -138,14 +213,106 @@ LOGIN_URL = "/auth/login/"
 LOGIN_REDIRECT_URL = "index"
 # LOGOUT_REDIRECT_URL = "index"
 
+# письма ставятся в очередь и отправляются воркером (jobs.tasks)
+EMAIL_BACKEND = "jobs.mail.QueuedEmailBackend"
 #  подключаем движок filebased.EmailBackend
-EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
+EMAIL_DELIVERY_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
-
-
+# сколько писем выбирать за раз, число попыток и база задержки повтора
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_RETRY_BACKOFF = 30
+# через сколько секунд письма оборвавшейся отправки можно взять снова
+EMAIL_CLAIM_TIMEOUT = 10 * 60
+
+
+# Фоновые задачи: manage.py run_worker
+# база задержки повтора в секундах, удваивается с каждой попыткой
+JOB_RETRY_BACKOFF = 10
+# воркер раз в JOB_HEARTBEAT_INTERVAL секунд отмечает свои задачи и
+# возвращает в очередь задачи без отметки дольше JOB_TIMEOUT секунд
+JOB_HEARTBEAT_INTERVAL = 60
+JOB_TIMEOUT = 10 * 60
+# сколько дней хранить выполненные задачи
+JOB_KEEP_DAYS = 7
+
+# Метрики Prometheus на /metrics. Процессы сбрасывают снимки в
+# METRICS_DIR, эндпоинт их суммирует; без METRICS_DIR - только свой процесс
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+# /metrics доступен персоналу и с заголовком Authorization: Bearer <токен>;
+# None - только персоналу
+METRICS_TOKEN = None
+# запросы дольше порога (мс) пишутся в лог yatube.slow_queries с EXPLAIN,
+# сводка по отпечаткам SQL - manage.py top_queries (нужен METRICS_DIR)
+QUERYLOG_SLOW_MS = 100
+
+# Профилирование запросов включается заданием PROFILE_DIR. Профилируется
+# в среднем каждый PROFILE_SAMPLE_RATE-й запрос (0 - только по заголовку
+# X-Profile-Token, см. manage.py profile_report --token).
+# PROFILE_MODE: 'sample' - свёрнутые стеки, 'cprofile' - pstats
+PROFILE_DIR = None
+PROFILE_SAMPLE_RATE = 0
+PROFILE_MODE = 'sample'
+PROFILE_INTERVAL = 0.005
+PROFILE_TOKEN_MAX_AGE = 3600
+
+# tracemalloc: глубина стека выделений (0 - выключено) и период снимков.
+# Отчёт - /debug/memory для персонала или kill -USR2 <pid> в лог
+MEMORY_TRACE_FRAMES = 0
+MEMORY_SNAPSHOT_INTERVAL = 300
+
+# Прогрев воркера в wsgi.py: URL, переводы, шаблоны, Site и запросы
+# к WARMUP_URLS до приёма трафика, время шагов - в лог yatube.startup
+WARMUP = True
+WARMUP_URLS = ['/']
+WARMUP_HOST = 'localhost'
+
+THUMBNAIL_BACKEND = 'yatube.thumbnail.CountingThumbnailBackend'
+
+# Кэш процесса годится для разработки. В продакшене с несколькими
+# процессами нужен общий кэш, например
+# yatube.instrumentation.InstrumentedMemcachedCache с LOCATION: иначе
+# отметки лент не кэшируются, а сброшенные сигналами ключи живут в
+# других процессах до LOCAL_CACHE_TIMEOUT секунд (см. yatube.caches)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.instrumentation.InstrumentedLocMemCache',
     }
-}
\ No newline at end of file
+}
+LOCAL_CACHE_TIMEOUT = 10
+
+
+# Строки лога запросов от ServerTimingMiddleware, в разработке скрыты
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING' if DEBUG else 'INFO',
+            'propagate': False,
+        },
+        'yatube.startup': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'yatube.memory': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'yatube.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,88 @@
+"""Статика с хэшами в именах и заранее сжатыми копиями.
+
+collectstatic с CompressedManifestStaticFilesStorage кладёт рядом с
+каждым текстовым файлом копии .gz и, если установлен brotli, .br.
+serve_static отдаёт подходящую копию по Accept-Encoding, а файлам с
+хэшем в имени ставит кэширование на год.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .compression import accepted_encodings, brotli, compress
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json',
+                         '.map', '.xml', '.ico')
+HASHED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def encodings():
+    return (('br', '.br'), ('gzip', '.gz')) if brotli else (('gzip', '.gz'),)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # без манифеста лучше отдать исходное имя, чем упасть с 500
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in self.hashed_files.values():
+            if not name.endswith(COMPRESSED_EXTENSIONS):
+                continue
+            with self.open(name) as source:
+                data = source.read()
+            for encoding, suffix in encodings():
+                compressed = compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
+                yield name + suffix, name + suffix, True
+
+
+def serve_static(request, path):
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if not os.path.isfile(fullpath):
+        raise Http404
+    content_type, _ = mimetypes.guess_type(fullpath)
+    accepted = accepted_encodings(request)
+    encoding = None
+    for candidate, suffix in encodings():
+        if candidate in accepted and os.path.isfile(fullpath + suffix):
+            encoding = candidate
+            fullpath += suffix
+            break
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+    response = FileResponse(open(fullpath, 'rb'),
+                            content_type=content_type or
+                            'application/octet-stream')
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if path.endswith(COMPRESSED_EXTENSIONS):
+        patch_vary_headers(response, ('Accept-Encoding',))
+    response['Cache-Control'] = (
+        IMMUTABLE if HASHED.search(path) else 'public, max-age=300')
+    return response
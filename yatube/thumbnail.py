@@ -0,0 +1,11 @@
+from sorl.thumbnail.base import ThumbnailBackend
+
+from . import metrics
+
+
+class CountingThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который считает созданные миниатюры."""
+
+    def _create_thumbnail(self, *args, **kwargs):
+        super()._create_thumbnail(*args, **kwargs)
+        metrics.inc('thumbnails_generated_total')
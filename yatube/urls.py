@@ -14,31 +14,47 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 '''
 from django.contrib import admin
-from django.urls import include, path
-from django.contrib.flatpages import views
+from django.urls import include, path, re_path
 from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .memory import memory_view
+from .metrics import metrics_view
+from .staticfiles import serve_static
+from posts.flatpages import flatpage
+from posts.sitemaps import sitemap_chunk, sitemap_index
+
 handler404 = 'posts.views.page_not_found'
 handler500 = 'posts.views.server_error'
 
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
+    path('debug/memory', memory_view, name='memory'),
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-<str:section>-<int:number>.xml', sitemap_chunk,
+         name='sitemap_chunk'),
     path('', include('posts.urls')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
-    path('about/', include('django.contrib.flatpages.urls')),
+    path('about/<path:url>', flatpage,
+         name='django.contrib.flatpages.views.flatpage'),
 
 ]
 
+# раньше posts.urls, иначе эти адреса перехватывает профиль <username>/
+urlpatterns = [
+        path('about-us/', flatpage, {'url': '/about-us/'}, name='about'),
+        path('terms/', flatpage, {'url': '/terms/'}, name='terms'),
+        path('about-author/', flatpage, {'url': '/about-author/'}, name='about-author'),
+        path('about-spec/', flatpage, {'url': '/about-spec/'}, name='about-spec'),
+] + urlpatterns
+
 urlpatterns += [
-        path('about-us/', views.flatpage, {'url': '/about-us/'}, name='about'),
-        path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
-        path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about-author'),
-        path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='about-spec'),
+    re_path(r'^{}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')),
+            serve_static, name='static'),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,171 @@
+"""Прогрев воркера до приёма запросов.
+
+build_application собирает WSGI-приложение и сразу прогревает его:
+загружает URL-резолвер со всеми view, каталоги перевода, компилирует
+шаблоны в кэширующий загрузчик, достаёт текущий Site и прогоняет
+WARMUP_URLS и flatpages через само приложение. Время каждого шага пишется в лог
+yatube.startup одной строкой.
+"""
+import contextlib
+import logging
+import os
+import time
+from wsgiref.util import setup_testing_defaults
+
+logger = logging.getLogger('yatube.startup')
+
+
+class StartupReport:
+    def __init__(self):
+        self.steps = []
+        self.started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        yield
+        self.steps.append((name, time.perf_counter() - started, ''))
+
+    def step(self, name, func, *args):
+        started = time.perf_counter()
+        try:
+            detail = func(*args)
+        except Exception as error:
+            detail = f'ошибка: {error!r}'
+        self.steps.append((name, time.perf_counter() - started, detail))
+
+    def render(self):
+        total = time.perf_counter() - self.started
+        parts = [f'total={total * 1000:.0f}ms'] + [
+            f'{name}={elapsed * 1000:.0f}ms'
+            + (f' ({detail})' if detail else '')
+            for name, elapsed, detail in self.steps]
+        return ' '.join(parts)
+
+
+def load_urls():
+    from django.urls import get_resolver
+
+    # reverse_dict обходит все include, попутно импортируя модули view
+    return f'{len(get_resolver().reverse_dict)} имён'
+
+
+def load_translations():
+    from django.conf import settings
+    from django.utils import formats, translation
+
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.gettext('Home')
+    formats.get_format('DATETIME_FORMAT')
+    return settings.LANGUAGE_CODE
+
+
+def template_names(directory):
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(('.html', '.txt', '.xml')):
+                yield os.path.relpath(os.path.join(root, name), directory)
+
+
+def project_template_dirs():
+    """Каталоги шаблонов проекта: templates/ и templates/ своих приложений."""
+    from django.conf import settings
+    from django.template import engines
+
+    return [directory for backend in engines.all()
+            for directory in getattr(backend, 'template_dirs', ())
+            if str(directory).startswith(settings.BASE_DIR)]
+
+
+def compile_templates(dirs=None):
+    """Компилирует шаблоны из dirs (по умолчанию из всех каталогов
+    шаблонов). С кэширующим загрузчиком результат остаётся в его кэше.
+    Возвращает число шаблонов и пары (имя, ошибка) для сломанных."""
+    from django.template import engines
+
+    count, errors = 0, []
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is None:
+            continue
+        for directory in dirs or backend.template_dirs:
+            for name in template_names(directory):
+                count += 1
+                try:
+                    engine.get_template(name)
+                except Exception as error:
+                    errors.append((name, error))
+    return count, errors
+
+
+def load_templates():
+    count, errors = compile_templates(project_template_dirs())
+    return f'{count} шт., ошибок {len(errors)}'
+
+
+def load_site():
+    from django.apps import apps
+
+    if not apps.is_installed('django.contrib.sites'):
+        return ''
+    from django.contrib.sites.models import Site
+
+    return Site.objects.get_current().domain
+
+
+def request_urls(application, urls=None):
+    from django.conf import settings
+
+    statuses = []
+    if urls is None:
+        urls = getattr(settings, 'WARMUP_URLS', ['/'])
+    for url in urls:
+        environ = {'PATH_INFO': url,
+                   'HTTP_HOST': getattr(settings, 'WARMUP_HOST', 'localhost')}
+        setup_testing_defaults(environ)
+        result = []
+        body = application(environ, lambda status, headers: result.append(
+            status.split()[0]))
+        b''.join(body)
+        getattr(body, 'close', lambda: None)()
+        statuses.append(f'{url} {result[0]}')
+    return ', '.join(statuses)
+
+
+def request_flatpages(application):
+    """Рендерит flatpages в кэш (posts.flatpages) запросами через /about/."""
+    from posts.flatpages import public_urls
+
+    return request_urls(application,
+                        ['/about' + url for url in public_urls()])
+
+
+def warm_up(application, report=None):
+    report = report or StartupReport()
+    report.step('urls', load_urls)
+    report.step('i18n', load_translations)
+    report.step('templates', load_templates)
+    report.step('site', load_site)
+    report.step('requests', request_urls, application)
+    report.step('flatpages', request_flatpages, application)
+    return report
+
+
+def build_application():
+    """То же, что get_wsgi_application, но с прогревом и отчётом."""
+    report = StartupReport()
+    with report.measure('imports'):
+        import django
+        from django.core.handlers.wsgi import WSGIHandler
+    # импорт приложений и моделей
+    with report.measure('apps'):
+        django.setup(set_prefix=False)
+    # загрузка цепочки middleware
+    with report.measure('handler'):
+        application = WSGIHandler()
+    from django.conf import settings
+
+    if getattr(settings, 'WARMUP', True):
+        warm_up(application, report)
+    logger.info('startup %s', report.render())
+    return application